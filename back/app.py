@@ -1,49 +1,603 @@
+import hashlib
 import logging
-from datetime import datetime
-from flask import Flask, request, jsonify
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS  # Import CORS
 import psycopg
 import postgres_db as pgdb
 import os
+from response_cache import ResponseCache
+from range_cache import TickerRangeCache
+from compression import Compressor
+from logging_setup import setup_logging
+import metrics
+from downsample import DOWNSAMPLE_FIELDS, downsample_columns, downsample_rows
+from serialization import ARROW_MIMETYPE, FastJSONProvider, dumps_bytes, to_arrow_ipc, to_columnar
+import serialization
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app, resources={r"/api/*": {"origins": ["http://localhost:4200", "http://michaelleitsin.com"]}})
 
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG,  # Set the logging level
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("app.log"),  # Log to a file
-                        logging.StreamHandler()  # Log to console
-                    ])
+# Configure logging: a background thread writes to app.log and the console
+setup_logging()
 
 logger = logging.getLogger(__name__)
 logger.debug("This is a debug message")
 
+MAX_BATCH_TICKERS = 20
+MAX_BATCH_ARTICLES = 100
+MAX_FILTER_VALUES = 20
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 5000
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+RESPONSE_FORMATS = ('rows', 'columnar', 'arrow')
+# Batch layouts: rows per ticker, or each article once plus per-ticker (article_id, sentiment, relevance) series
+BATCH_SHAPES = ('tickers', 'articles')
+
+# Serialized responses of the sentiment endpoints, dropped whenever data is (re)loaded
+response_cache = ResponseCache(max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                               ttl=float(os.getenv('RESPONSE_CACHE_TTL', 300)))
+pgdb.data_loaded_listeners.append(response_cache.invalidate)
+# Raw rows per ticker, so narrower ranges and higher thresholds are answered without the database
+range_cache = TickerRangeCache(max_rows=int(os.getenv('RANGE_CACHE_MAX_ROWS', 200_000)),
+                               max_bytes=int(os.getenv('RANGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+                               ttl=float(os.getenv('RANGE_CACHE_TTL', 300)))
+pgdb.data_loaded_listeners.append(range_cache.invalidate)
+compressor = Compressor(min_size=int(os.getenv('COMPRESS_MIN_SIZE', 1024)),
+                        gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', 6)),
+                        brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', 5)))
+
 
 def validate_date(date_text):
     try:
         return datetime.strptime(date_text, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def _arg(args, name, convert, default=None):
+    """
+    Reads a query parameter with the given conversion, or default if it is missing or empty.
+
+    Raises:
+        ValueError: If the parameter is present but can't be converted.
+    """
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number') from None
+
+
+def _list_arg(args, name):
+    """Reads a comma-separated query parameter as a sorted tuple of distinct values."""
+    return tuple(sorted({value.strip() for value in args.get(name, '').split(',') if value.strip()}))
+
+
+def parse_filters(args):
+    """
+    Parses the sources=, exclude_sources=, topics= and topic_relevance= query parameters.
+
+    Raises:
+        ValueError: If a list has more than MAX_FILTER_VALUES values.
+    """
+    filters = pgdb.SentimentFilters(
+        sources=_list_arg(args, 'sources'),
+        exclude_sources=_list_arg(args, 'exclude_sources'),
+        topics=_list_arg(args, 'topics'),
+        topic_relevance=_arg(args, 'topic_relevance', float, 0.),
+    )
+    for name in ('sources', 'exclude_sources', 'topics'):
+        if len(getattr(filters, name)) > MAX_FILTER_VALUES:
+            raise ValueError(f'At most {MAX_FILTER_VALUES} {name} per request')
+    return filters
+
+
+def parse_sentiment_args(args):
+    """
+    Parses and validates the /api/sentiment query parameters (shared by the Flask and the ASGI app).
+
+    Args:
+        args (Mapping): The query parameters.
+
+    Returns:
+        SimpleNamespace: ticker, start_date, end_date, relevance_threshold, interval, stream_format, limit, after,
+        response_format, max_points, fields and filters. With max_points, fields include DOWNSAMPLE_FIELDS.
+
+    Raises:
+        ValueError: With the message for the 400 response.
+    """
+    query = SimpleNamespace(
+        ticker=args.get('ticker'),
+        start_date=validate_date(args.get('start_date')),
+        end_date=validate_date(args.get('end_date')),
+        relevance_threshold=_arg(args, 'relevance_score', float, 0.),
+        interval=args.get('interval'),
+        stream_format=args.get('stream'),
+        limit=_arg(args, 'limit', int),
+        after=args.get('after'),
+        response_format=args.get('format', 'rows'),
+        max_points=_arg(args, 'max_points', int),
+        fields=pgdb.resolve_fields(args.get('fields')),
+        filters=parse_filters(args),
+    )
+    if query.max_points:
+        query.fields = tuple(f for f in pgdb.SENTIMENT_FIELDS if f in query.fields or f in DOWNSAMPLE_FIELDS)
+
+    if not query.ticker or not query.start_date or not query.end_date:
+        raise ValueError('Missing parameters')
+    _validate_format(query.response_format)
+    if query.response_format == 'arrow' and (query.stream_format or query.limit or query.after):
+        raise ValueError('format=arrow can not be streamed or paged')
+    if query.interval and query.interval not in pgdb.BUCKET_INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(pgdb.BUCKET_INTERVALS)}")
+    if query.stream_format and query.stream_format not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    if query.limit is not None and not 0 < query.limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_LIMIT}')
+    if query.max_points is not None and query.max_points < 3:
+        raise ValueError('max_points must be at least 3')
+    if query.max_points and (query.interval or query.stream_format or query.limit or query.after):
+        raise ValueError('max_points applies to raw rows, not to interval, stream or paged responses')
+    return query
+
+
+def parse_batch_args(args):
+    """
+    Parses and validates the /api/sentiment/batch query parameters (shared by the Flask and the ASGI app).
+
+    Returns:
+        SimpleNamespace: tickers, start_date, end_date, relevance_threshold, response_format, shape, fields and filters.
+
+    Raises:
+        ValueError: With the message for the 400 response.
+    """
+    query = SimpleNamespace(
+        tickers=list(dict.fromkeys(t.strip() for t in args.get('tickers', '').split(',') if t.strip())),
+        start_date=validate_date(args.get('start_date')),
+        end_date=validate_date(args.get('end_date')),
+        relevance_threshold=_arg(args, 'relevance_score', float, 0.),
+        response_format=args.get('format', 'rows'),
+        shape=args.get('shape', 'tickers'),
+        fields=pgdb.resolve_fields(args.get('fields')),
+        filters=parse_filters(args),
+    )
+
+    if not query.tickers or not query.start_date or not query.end_date:
+        raise ValueError('Missing parameters')
+    _validate_format(query.response_format)
+    if query.shape not in BATCH_SHAPES:
+        raise ValueError(f"shape must be one of {', '.join(BATCH_SHAPES)}")
+    if query.shape == 'articles' and query.response_format == 'arrow':
+        raise ValueError('shape=articles is only available as JSON')
+    if len(query.tickers) > MAX_BATCH_TICKERS:
+        raise ValueError(f'At most {MAX_BATCH_TICKERS} tickers per request')
+    return query
+
+
+def parse_facets_args(args):
+    """
+    Parses and validates the /api/facets query parameters; ticker= may list several comma-separated tickers.
+
+    Returns:
+        SimpleNamespace: tickers, start_date and end_date.
+
+    Raises:
+        ValueError: With the message for the 400 response.
+    """
+    query = SimpleNamespace(
+        tickers=list(dict.fromkeys(t.strip() for t in args.get('ticker', '').split(',') if t.strip())),
+        start_date=validate_date(args.get('start_date')),
+        end_date=validate_date(args.get('end_date')),
+    )
+
+    if not query.tickers or not query.start_date or not query.end_date:
+        raise ValueError('Missing parameters')
+    if len(query.tickers) > MAX_BATCH_TICKERS:
+        raise ValueError(f'At most {MAX_BATCH_TICKERS} tickers per request')
+    return query
+
+
+def parse_article_ids(args):
+    """
+    Parses the ids= parameter of /api/articles.
+
+    Raises:
+        ValueError: With the message for the 400 response.
+    """
+    try:
+        article_ids = list(dict.fromkeys(int(i) for i in args.get('ids', '').split(',') if i.strip()))
     except ValueError:
+        raise ValueError('ids must be comma-separated integers')
+
+    if not article_ids:
+        raise ValueError('Missing parameters')
+    if len(article_ids) > MAX_BATCH_ARTICLES:
+        raise ValueError(f'At most {MAX_BATCH_ARTICLES} articles per request')
+    return article_ids
+
+
+def _validate_format(response_format):
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(RESPONSE_FORMATS)}")
+    if response_format == 'arrow' and serialization.pa is None:
+        raise ValueError('format=arrow is not available on this server')
+
+
+def sentiment_cache_key(query):
+    return ('sentiment', (query.ticker,), query.start_date, query.end_date, query.relevance_threshold, query.fields,
+            query.interval, query.response_format, query.max_points, query.filters)
+
+
+def batch_cache_key(query):
+    return ('batch', tuple(query.tickers), query.start_date, query.end_date, query.relevance_threshold, query.fields,
+            query.response_format, query.shape, query.filters)
+
+
+def facets_cache_key(query):
+    return ('facets', tuple(query.tickers), query.start_date, query.end_date)
+
+
+def json_body(data):
+    """Serializes data the same way jsonify does, to bytes that can be cached."""
+    return dumps_bytes(data) + b'\n'
+
+
+@metrics.timed('encode')
+def encode_rows(data, response_format):
+    """
+    Serializes rows (or buckets) of the single ticker endpoint in the requested format.
+
+    Returns:
+        tuple: (body bytes, mimetype).
+    """
+    if response_format == 'arrow':
+        return to_arrow_ipc(to_columnar(data)), ARROW_MIMETYPE
+    return json_body(to_columnar(data) if response_format == 'columnar' else data), 'application/json'
+
+
+@metrics.timed('encode')
+def encode_batch(data, response_format):
+    """Serializes the ticker -> rows map of the batch endpoint as JSON (rows or columnar); see encode_rows."""
+    if response_format == 'columnar':
+        data = {ticker: to_columnar(rows) for ticker, rows in data.items()}
+    return json_body(data), 'application/json'
+
+
+@metrics.timed('encode')
+def encode_columns(columns):
+    """Serializes typed columns (see fetch_ticker_columns) as Arrow; returns (body bytes, mimetype)."""
+    return to_arrow_ipc(columns), ARROW_MIMETYPE
+
+
+def article_ids_of(series):
+    """The distinct article ids of per-ticker series rows, in ascending order."""
+    return sorted({row['article_id'] for rows in series.values() for row in rows})
+
+
+@metrics.timed('encode')
+def encode_articles(series, articles):
+    """
+    Serializes the shape=articles batch body: each article once, keyed by id, and per-ticker columnar series.
+
+    Args:
+        series (dict): Ticker -> rows with the SERIES_FIELDS.
+        articles (dict): Article id -> article fields.
+
+    Returns:
+        tuple: (body bytes, mimetype).
+    """
+    return json_body({
+        'articles': {article_id: {f: v for f, v in article.items() if f != 'article_id'} for article_id, article in articles.items()},
+        'series': {ticker: to_columnar(rows) for ticker, rows in series.items()},
+    }), 'application/json'
+
+
+def page_body(page, response_format):
+    data, next_cursor = page
+    return {'data': to_columnar(data) if response_format == 'columnar' else data, 'next_cursor': next_cursor}
+
+
+def cached_response(entry, etag=None, cache_key=None):
+    response = Response(entry.data, mimetype=entry.mimetype)
+    g.cached_body = (cache_key, entry)  # Lets compress_response reuse and store compressed copies
+    if etag:
+        response.set_etag(etag)
+    if entry.last_modified:
+        response.last_modified = entry.last_modified
+    return response
+
+
+def etag_for_version(version, cache_key):
+    """Strong ETag from the data version and the normalized query, or None if the version is unknown."""
+    if version is None:
+        return None
+    return hashlib.sha1(repr((version, cache_key)).encode()).hexdigest()
+
+
+def make_etag(cache_key):
+    return etag_for_version(pgdb.current_data_version(), cache_key)
+
+
+def matching_etag(etag, if_none_match):
+    """Returns the ETag the client already holds, the plain one or a compressed representation's, or None."""
+    # Compressed representations carry the encoding as an ETag suffix
+    for candidate in (etag, *(f'{etag}-{encoding}' for encoding in compressor.encodings)):
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def unmodified_since(last_published, if_modified_since):
+    return bool(last_published) and last_published.replace(microsecond=0, tzinfo=timezone.utc) <= if_modified_since
+
+
+def not_modified(cached, etag, tickers, start_date, end_date, relevance_threshold):
+    """
+    Answers If-None-Match / If-Modified-Since without running the query.
+
+    Returns:
+        Response: A 304 response if the client's copy is current, else None.
+    """
+    if etag is None:
         return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    if request.if_none_match:
+        candidate = matching_etag(etag, request.if_none_match)
+        if candidate is None:
+            return None
+        response.set_etag(candidate)
+        return response
+    if request.if_modified_since:
+        last_published = cached.last_modified if cached else pgdb.fetch_last_published(tickers, start_date, end_date, relevance_threshold)
+        if unmodified_since(last_published, request.if_modified_since):
+            return response
+    return None
+
+
+@metrics.timed('compress')
+def compressed_body(data, encoding, cache_key=None, entry=None):
+    """Returns data compressed with encoding, reusing or storing the compressed copy of a cached body."""
+    body = entry.encodings.get(encoding) if entry is not None else None
+    if body is None:
+        body = compressor.compress(data, encoding)
+        if cache_key is not None:
+            response_cache.add_encoding(cache_key, encoding, body)
+    return body
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.endpoint.set(request.endpoint or 'unknown')
+
+
+# Registered before compress_response, so it runs after it and counts the compressed size
+@app.after_request
+def record_request_metrics(response):
+    """Records the request's handler time now, and its total time and body size once the body has been sent."""
+    endpoint, status, started = request.endpoint or 'unknown', response.status_code, g.request_started
+    handled = time.perf_counter() - started
+    size = [0]
+    if response.is_streamed:
+        chunks = response.response
+
+        def counted():
+            for chunk in chunks:
+                size[0] += len(chunk)
+                yield chunk
+        response.response = counted()
+    else:
+        size[0] = response.content_length or 0
+    response.call_on_close(lambda: metrics.record_request(endpoint, status, handled, time.perf_counter() - started, size[0]))
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Applies negotiated gzip/brotli encoding to buffered API responses, reusing compressed copies of cached bodies."""
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < compressor.min_size:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compressor.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compressed_body(data, encoding, *g.get('cached_body', (None, None))))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def stream_rows(chunks, stream_format):
+    """Serializes row chunks as they arrive, either as NDJSON lines or as one chunked JSON array."""
+    if stream_format == 'ndjson':
+        for chunk in chunks:
+            with metrics.timed('encode'):
+                body = b''.join(dumps_bytes(row) + b'\n' for row in chunk)
+            yield body
+        return
+
+    separator = b'['
+    for chunk in chunks:
+        with metrics.timed('encode'):
+            body = separator + b','.join(dumps_bytes(row) for row in chunk)
+        yield body
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
 
 
 @app.route('/api/sentiment', methods=['GET'])
 def get_sentiment():
-    ticker = request.args.get('ticker')
-    start_date = validate_date(request.args.get('start_date'))
-    end_date = validate_date(request.args.get('end_date'))
-    relevance_threshold = float(request.args.get('relevance_score', default=0., type=float))
+    try:
+        q = parse_sentiment_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Streamed responses are written chunk by chunk; an empty result is an empty body, not a 404
+    if q.stream_format and not q.interval:
+        chunks = pgdb.iter_ticker_data(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                       filters=q.filters)
+        if chunks is None:
+            return jsonify({'error': 'Database error'}), 500
+        return Response(stream_rows(chunks, q.stream_format), mimetype=STREAM_FORMATS[q.stream_format])
 
-    if not ticker or not start_date or not end_date:
-        return jsonify({'error': 'Missing parameters'}), 400
+    # Keyset pagination: one page plus the cursor to request the next one with
+    if (q.limit or q.after) and not q.interval:
+        try:
+            page = pgdb.fetch_ticker_page(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.limit or DEFAULT_PAGE_LIMIT,
+                                          q.after, q.fields, q.filters)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if page is None:
+            return jsonify({'error': 'Database error'}), 500
+        return jsonify(page_body(page, q.response_format))
+
+    cache_key = sentiment_cache_key(q)
+    etag = make_etag(cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = not_modified(cached, etag, [q.ticker], q.start_date, q.end_date, q.relevance_threshold)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(cached, etag, cache_key)
 
     try:
-        data = pgdb.fetch_ticker_data(ticker, start_date, end_date, relevance_threshold)
-        if not data:
-            return jsonify({'error': 'No data found'}), 404
-        return jsonify(data)
+        if q.response_format == 'arrow' and not q.interval:
+            # Built from tuple rows straight into typed Arrow columns (downsampled as columns, so the casts still apply)
+            columns = pgdb.fetch_ticker_columns([q.ticker], q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                                filters=q.filters)
+            if not columns or not next(iter(columns.values())):
+                return jsonify({'error': 'No data found'}), 404
+            if q.max_points:
+                columns = downsample_columns(columns, q.max_points)
+            body, mimetype = encode_columns(columns)
+        else:
+            if q.interval:
+                data = pgdb.fetch_ticker_buckets(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.interval,
+                                                 q.filters)
+            else:
+                data = range_cache.query(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.fields, q.filters)
+            if data and q.max_points:
+                data = downsample_rows(data, q.max_points)
+            if not data:
+                return jsonify({'error': 'No data found'}), 404
+            body, mimetype = encode_rows(data, q.response_format)
+        last_published = pgdb.fetch_last_published([q.ticker], q.start_date, q.end_date, q.relevance_threshold)
+        return cached_response(response_cache.put(cache_key, body, mimetype, last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sentiment/batch', methods=['GET'])
+def get_sentiment_batch():
+    try:
+        q = parse_batch_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cache_key = batch_cache_key(q)
+    etag = make_etag(cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = not_modified(cached, etag, q.tickers, q.start_date, q.end_date, q.relevance_threshold)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(cached, etag, cache_key)
+
+    try:
+        if q.response_format == 'arrow':
+            # One table for all tickers, with a leading ticker column
+            columns = pgdb.fetch_ticker_columns(q.tickers, q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                                with_ticker=True, filters=q.filters)
+            if columns is None:
+                return jsonify({'error': 'Database error'}), 500
+            body, mimetype = encode_columns(columns)
+        elif q.shape == 'articles':
+            # Series read ticker_sentiment alone; all_news is read once per article, however many tickers mention it
+            series = range_cache.query_many(q.tickers, q.start_date, q.end_date, q.relevance_threshold, pgdb.SERIES_FIELDS, q.filters)
+            if series is None:
+                return jsonify({'error': 'Database error'}), 500
+            article_fields = tuple(f for f in q.fields if f in pgdb.ARTICLE_FIELDS)
+            articles = pgdb.fetch_articles(article_ids_of(series), article_fields)
+            if articles is None:
+                return jsonify({'error': 'Database error'}), 500
+            body, mimetype = encode_articles(series, articles)
+        else:
+            data = range_cache.query_many(q.tickers, q.start_date, q.end_date, q.relevance_threshold, q.fields, q.filters)
+            if data is None:
+                return jsonify({'error': 'Database error'}), 500
+            body, mimetype = encode_batch(data, q.response_format)
+        last_published = pgdb.fetch_last_published(q.tickers, q.start_date, q.end_date, q.relevance_threshold)
+        return cached_response(response_cache.put(cache_key, body, mimetype, last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Sources and topics with article counts, for the chart's filter options
+@app.route('/api/facets', methods=['GET'])
+def get_facets():
+    try:
+        q = parse_facets_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cache_key = facets_cache_key(q)
+    etag = make_etag(cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = not_modified(cached, etag, q.tickers, q.start_date, q.end_date, 0.)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(cached, etag, cache_key)
+
+    try:
+        facets = pgdb.fetch_facets(q.tickers, q.start_date, q.end_date)
+        if facets is None:
+            return jsonify({'error': 'Database error'}), 500
+        last_published = pgdb.fetch_last_published(q.tickers, q.start_date, q.end_date)
+        return cached_response(response_cache.put(cache_key, json_body(facets), last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/article/<int:article_id>', methods=['GET'])
+def get_article(article_id):
+    try:
+        articles = pgdb.fetch_articles([article_id])
+        if articles is None:
+            return jsonify({'error': 'Database error'}), 500
+        if article_id not in articles:
+            return jsonify({'error': 'Article not found'}), 404
+        return jsonify(articles[article_id])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/articles', methods=['GET'])
+def get_articles():
+    try:
+        article_ids = parse_article_ids(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        articles = pgdb.fetch_articles(article_ids)
+        if articles is None:
+            return jsonify({'error': 'Database error'}), 500
+        return jsonify({str(article_id): article for article_id, article in articles.items()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -66,6 +620,41 @@ def db_info():
     return jsonify({'host': host, 'db_name': db_name, 'lang (test environ)': lang})
 
 
+# Response and range cache sizes and hit/miss counters
+@app.route('/api/cachestats', methods=['GET'])
+def cache_stats():
+    return jsonify({'responses': response_cache.stats(), 'ranges': range_cache.stats()})
+
+
+# Drop cached responses after an out-of-process data load (all tickers, or ?ticker=...)
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'error': 'Forbidden'}), 403
+    response_cache.invalidate(request.args.get('ticker'))
+    range_cache.invalidate(request.args.get('ticker'))
+    return jsonify({'responses': response_cache.stats(), 'ranges': range_cache.stats()})
+
+
+# Connection pool config and usage counters
+@app.route('/api/poolstats', methods=['GET'])
+def pool_stats():
+    return jsonify(pgdb.pool_stats())
+
+
+# Execution counts and latency per prepared query
+@app.route('/api/querystats', methods=['GET'])
+def query_stats():
+    return jsonify(pgdb.query_stats())
+
+
+# Stage timings, rows and response bytes per endpoint, in the Prometheus text format
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.PROMETHEUS_MIMETYPE)
+
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,368 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match, Route
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags
+import metrics
+import postgres_db as pgdb
+from downsample import downsample_columns, downsample_rows
+from app import (DEFAULT_PAGE_LIMIT, STREAM_FORMATS, article_ids_of, batch_cache_key, compressed_body, compressor,
+                 encode_articles, encode_batch, encode_columns, encode_rows, etag_for_version, facets_cache_key, json_body, matching_etag,
+                 page_body, parse_article_ids, parse_batch_args, parse_facets_args, parse_sentiment_args, range_cache,
+                 response_cache, sentiment_cache_key, unmodified_since)
+from serialization import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# The same /api/* routes as app.py, served on an event loop: database queries run on psycopg AsyncConnections from
+# the async pool, so many outstanding queries share a few threads instead of holding one waitress thread each.
+# Caches, compression and ETags are shared with the Flask app through the helpers it exports.
+
+
+def error(message, status):
+    return Response(json_body({'error': message}), status_code=status, media_type='application/json')
+
+
+def json_response(request, data):
+    return respond(request, json_body(data), 'application/json')
+
+
+def respond(request, data, mimetype, etag=None, last_modified=None, cache_key=None, entry=None):
+    """Builds a 200 response, applying negotiated gzip/brotli encoding as the Flask app's compress_response does."""
+    headers = {}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    if len(data) >= compressor.min_size:
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = compressor.negotiate(parse_accept_header(request.headers.get('accept-encoding')))
+        if encoding is not None:
+            data = compressed_body(data, encoding, cache_key, entry)
+            headers['Content-Encoding'] = encoding
+            etag = f'{etag}-{encoding}' if etag else None
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    return Response(data, media_type=mimetype, headers=headers)
+
+
+def cached_response(request, entry, etag, cache_key):
+    return respond(request, entry.data, entry.mimetype, etag, entry.last_modified, cache_key, entry)
+
+
+async def not_modified(request, cached, etag, tickers, start_date, end_date, relevance_threshold):
+    """Async counterpart of app.not_modified: a 304 response if the client's copy is current, else None."""
+    if etag is None:
+        return None
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        candidate = matching_etag(etag, parse_etags(if_none_match))
+        return Response(status_code=304, headers={'ETag': f'"{candidate}"'}) if candidate else None
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    if if_modified_since:
+        last_published = cached.last_modified if cached else await pgdb.afetch_last_published(tickers, start_date, end_date, relevance_threshold)
+        if unmodified_since(last_published, if_modified_since):
+            return Response(status_code=304, headers={'ETag': f'"{etag}"'})
+    return None
+
+
+async def stream_rows(chunks, stream_format):
+    """Async app.stream_rows: serializes row chunks as they arrive, as NDJSON lines or one chunked JSON array."""
+    if stream_format == 'ndjson':
+        async for chunk in chunks:
+            with metrics.timed('encode'):
+                body = b''.join(dumps_bytes(row) + b'\n' for row in chunk)
+            yield body
+        return
+
+    separator = b'['
+    async for chunk in chunks:
+        with metrics.timed('encode'):
+            body = separator + b','.join(dumps_bytes(row) for row in chunk)
+        yield body
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+async def get_sentiment(request):
+    try:
+        q = parse_sentiment_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    # Streamed responses are written chunk by chunk; an empty result is an empty body, not a 404
+    if q.stream_format and not q.interval:
+        chunks = await pgdb.aiter_ticker_data(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                              filters=q.filters)
+        if chunks is None:
+            return error('Database error', 500)
+        return StreamingResponse(stream_rows(chunks, q.stream_format), media_type=STREAM_FORMATS[q.stream_format])
+
+    # Keyset pagination: one page plus the cursor to request the next one with
+    if (q.limit or q.after) and not q.interval:
+        try:
+            page = await pgdb.afetch_ticker_page(q.ticker, q.start_date, q.end_date, q.relevance_threshold,
+                                                 q.limit or DEFAULT_PAGE_LIMIT, q.after, q.fields, q.filters)
+        except ValueError as e:
+            return error(str(e), 400)
+        if page is None:
+            return error('Database error', 500)
+        return json_response(request, page_body(page, q.response_format))
+
+    cache_key = sentiment_cache_key(q)
+    etag = etag_for_version(await pgdb.acurrent_data_version(), cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = await not_modified(request, cached, etag, [q.ticker], q.start_date, q.end_date, q.relevance_threshold)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(request, cached, etag, cache_key)
+
+    try:
+        if q.response_format == 'arrow' and not q.interval:
+            # Built from tuple rows straight into typed Arrow columns (downsampled as columns, so the casts still apply)
+            columns = await pgdb.afetch_ticker_columns([q.ticker], q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                                       filters=q.filters)
+            if not columns or not next(iter(columns.values())):
+                return error('No data found', 404)
+            if q.max_points:
+                columns = downsample_columns(columns, q.max_points)
+            body, mimetype = encode_columns(columns)
+        else:
+            if q.interval:
+                data = await pgdb.afetch_ticker_buckets(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.interval,
+                                                        q.filters)
+            else:
+                data = await range_cache.aquery(q.ticker, q.start_date, q.end_date, q.relevance_threshold, q.fields, q.filters)
+            if data and q.max_points:
+                data = downsample_rows(data, q.max_points)
+            if not data:
+                return error('No data found', 404)
+            body, mimetype = encode_rows(data, q.response_format)
+        last_published = await pgdb.afetch_last_published([q.ticker], q.start_date, q.end_date, q.relevance_threshold)
+        return cached_response(request, response_cache.put(cache_key, body, mimetype, last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_sentiment_batch(request):
+    try:
+        q = parse_batch_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    cache_key = batch_cache_key(q)
+    etag = etag_for_version(await pgdb.acurrent_data_version(), cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = await not_modified(request, cached, etag, q.tickers, q.start_date, q.end_date, q.relevance_threshold)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(request, cached, etag, cache_key)
+
+    try:
+        if q.response_format == 'arrow':
+            # One table for all tickers, with a leading ticker column
+            columns = await pgdb.afetch_ticker_columns(q.tickers, q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                                       with_ticker=True, filters=q.filters)
+            if columns is None:
+                return error('Database error', 500)
+            body, mimetype = encode_columns(columns)
+        elif q.shape == 'articles':
+            # Series read ticker_sentiment alone; all_news is read once per article, however many tickers mention it
+            series = await range_cache.aquery_many(q.tickers, q.start_date, q.end_date, q.relevance_threshold, pgdb.SERIES_FIELDS,
+                                                   q.filters)
+            if series is None:
+                return error('Database error', 500)
+            article_fields = tuple(f for f in q.fields if f in pgdb.ARTICLE_FIELDS)
+            articles = await pgdb.afetch_articles(article_ids_of(series), article_fields)
+            if articles is None:
+                return error('Database error', 500)
+            body, mimetype = encode_articles(series, articles)
+        else:
+            data = await range_cache.aquery_many(q.tickers, q.start_date, q.end_date, q.relevance_threshold, q.fields,
+                                                   q.filters)
+            if data is None:
+                return error('Database error', 500)
+            body, mimetype = encode_batch(data, q.response_format)
+        last_published = await pgdb.afetch_last_published(q.tickers, q.start_date, q.end_date, q.relevance_threshold)
+        return cached_response(request, response_cache.put(cache_key, body, mimetype, last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+# Sources and topics with article counts, for the chart's filter options
+async def get_facets(request):
+    try:
+        q = parse_facets_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    cache_key = facets_cache_key(q)
+    etag = etag_for_version(await pgdb.acurrent_data_version(), cache_key)
+    cached = response_cache.get(cache_key)
+    unchanged = await not_modified(request, cached, etag, q.tickers, q.start_date, q.end_date, 0.)
+    if unchanged is not None:
+        return unchanged
+    if cached is not None:
+        return cached_response(request, cached, etag, cache_key)
+
+    try:
+        facets = await pgdb.afetch_facets(q.tickers, q.start_date, q.end_date)
+        if facets is None:
+            return error('Database error', 500)
+        last_published = await pgdb.afetch_last_published(q.tickers, q.start_date, q.end_date)
+        return cached_response(request, response_cache.put(cache_key, json_body(facets), last_modified=last_published), etag, cache_key)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_article(request):
+    article_id = request.path_params['article_id']
+    try:
+        articles = await pgdb.afetch_articles([article_id])
+        if articles is None:
+            return error('Database error', 500)
+        if article_id not in articles:
+            return error('Article not found', 404)
+        return json_response(request, articles[article_id])
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_articles(request):
+    try:
+        article_ids = parse_article_ids(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        articles = await pgdb.afetch_articles(article_ids)
+        if articles is None:
+            return error('Database error', 500)
+        return json_response(request, {str(article_id): article for article_id, article in articles.items()})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+# Test function to return the input received
+async def echo(request):
+    input_value = request.query_params.get('input', 'No input provided')
+    logger.info('Received input: %s', input_value)
+    return json_response(request, {'input': input_value})
+
+
+# Test function to return DB host and DB name
+async def db_info(request):
+    host = os.getenv('DB_HOST', None)
+    db_name = os.getenv('DB_NAME', None)
+    lang = os.getenv('LANG', None)
+    logger.info('DB info - Host: %s, DB Name: %s', host, db_name)
+    return json_response(request, {'host': host, 'db_name': db_name, 'lang (test environ)': lang})
+
+
+# Response and range cache sizes and hit/miss counters
+async def cache_stats(request):
+    return json_response(request, {'responses': response_cache.stats(), 'ranges': range_cache.stats()})
+
+
+# Drop cached responses after an out-of-process data load (all tickers, or ?ticker=...)
+async def invalidate_cache(request):
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('x-admin-token') != admin_token:
+        return error('Forbidden', 403)
+    response_cache.invalidate(request.query_params.get('ticker'))
+    range_cache.invalidate(request.query_params.get('ticker'))
+    return json_response(request, {'responses': response_cache.stats(), 'ranges': range_cache.stats()})
+
+
+# Connection pool config and usage counters
+async def pool_stats(request):
+    return json_response(request, pgdb.pool_stats())
+
+
+# Execution counts and latency per prepared query
+async def query_stats(request):
+    return json_response(request, pgdb.query_stats())
+
+
+# Stage timings, rows and response bytes per endpoint, in the Prometheus text format
+async def get_metrics(request):
+    return Response(metrics.render(), media_type=metrics.PROMETHEUS_MIMETYPE)
+
+
+class RequestMetricsMiddleware:
+    """
+    Labels each request with its route's endpoint name (the same function names as the Flask app) and records its
+    handler time (until the response starts), total time and body size, as the Flask app's record_request_metrics does.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def endpoint_name(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.name
+        return 'unknown'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        name = self.endpoint_name(scope)
+        token = metrics.endpoint.set(name)
+        started = time.perf_counter()
+        state = {'status': 500, 'handled': None, 'size': 0}
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                state['handled'] = time.perf_counter() - started
+            elif message['type'] == 'http.response.body':
+                state['size'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            total = time.perf_counter() - started
+            handled = total if state['handled'] is None else state['handled']
+            metrics.record_request(name, state['status'], handled, total, state['size'])
+            metrics.endpoint.reset(token)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await pgdb.get_async_pool()
+    yield
+    await pgdb.close_async_pool()
+
+
+routes = [
+    Route('/api/sentiment', get_sentiment, methods=['GET']),
+    Route('/api/sentiment/batch', get_sentiment_batch, methods=['GET']),
+    Route('/api/facets', get_facets, methods=['GET']),
+    Route('/api/article/{article_id:int}', get_article, methods=['GET']),
+    Route('/api/articles', get_articles, methods=['GET']),
+    Route('/api/echo', echo, methods=['GET']),
+    Route('/api/dbinfo', db_info, methods=['GET']),
+    Route('/api/cachestats', cache_stats, methods=['GET']),
+    Route('/api/cache/invalidate', invalidate_cache, methods=['POST']),
+    Route('/api/poolstats', pool_stats, methods=['GET']),
+    Route('/api/querystats', query_stats, methods=['GET']),
+    Route('/api/metrics', get_metrics, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetricsMiddleware, routes=routes),
+        Middleware(CORSMiddleware, allow_origins=["http://localhost:4200", "http://michaelleitsin.com"]),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,28 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+class Compressor:
+    """Negotiates and applies gzip/brotli content encoding for response bodies."""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)  # In order of preference
+
+    def negotiate(self, accept_encodings):
+        """Picks the encoding the client accepts with the highest quality (ties go to our preference), or None."""
+        candidates = [e for e in self.encodings if accept_encodings[e] > 0]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda e: accept_encodings[e])
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SSM_REGION = 'il-central-1'
+SSM_PARAMETERS = [
+    '/hybrid/config/db_host',
+    '/hybrid/config/db_port',
+    '/hybrid/config/db_user',
+    '/hybrid/config/db_password',
+    '/hybrid/config/db_name'
+]
+CONFIG_SOURCES = ('env', 'ssm', 'local')
+# Seconds between background re-reads of the SSM credentials (0 disables), and the minimum seconds between the
+# re-reads triggered by connection errors
+CREDENTIALS_TTL = float(os.getenv('DB_CREDENTIALS_TTL', 900))
+CREDENTIALS_RETRY_INTERVAL = float(os.getenv('DB_CREDENTIALS_RETRY_INTERVAL', 30))
+
+
+def is_running_on_ec2():
+    """Check if the code is running on an EC2 instance."""
+    import requests  # Only needed for the probe
+
+    try:
+        response = requests.get('http://169.254.169.254/latest/meta-data/', timeout=1)
+        if response.status_code in [200, 401]:
+            return True
+        else:
+            return False
+    except requests.RequestException:
+        return False
+
+
+def fetch_db_credentials():
+    """Fetch database credentials from AWS Systems Manager Parameter Store."""
+    import boto3  # Slow to import and only needed on EC2
+    from botocore.exceptions import ClientError
+
+    try:
+        ssm_client = boto3.client('ssm', region_name=SSM_REGION)
+        parameters = ssm_client.get_parameters(Names=SSM_PARAMETERS, WithDecryption=True)
+        return {param['Name'].split('/')[-1]: param['Value'] for param in parameters['Parameters']}
+    except ClientError as e:
+        logger.error(f"Failed to fetch parameters: {e}")
+        return {}
+
+
+def _env_flag(name):
+    value = os.getenv(name)
+    return None if value is None else value.strip().lower() in ('1', 'true', 'yes')
+
+
+class Config:
+    """
+    Runtime configuration resolved lazily on first use and then cached, so importing the backend does no network I/O.
+
+    Environment overrides:
+        RUNNING_ON_EC2: 1/0 skips the EC2 metadata probe.
+        DB_CONFIG_SOURCE: Where the connection info comes from: 'env' (DB_HOST, DB_PORT, DB_USER, DB_PASSWORD,
+            DB_NAME), 'ssm' (Parameter Store) or 'local' (credentials.py). Defaults to 'ssm' on EC2, else 'local'.
+        DB_SCHEMA: Schema of the news tables. Defaults to 'public' on EC2, else 'news_data'.
+        DB_CREDENTIALS_TTL: Seconds between background refreshes of SSM credentials, so a rotated password is picked
+            up without a restart.
+        LOG_LEVEL: Root logging level. Defaults to INFO.
+        LOG_LEVELS: Per-logger levels, e.g. 'postgres_db=WARNING,psycopg.pool=DEBUG'.
+
+    Every change of the connection info bumps credentials_version, which the connection pools compare against to know
+    when to rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._running_on_ec2 = None
+        self._credentials = None  # (conn_info, version), swapped as a whole so readers need no lock
+        self._loaded_at = 0.
+        self._refresher = None
+
+    @property
+    def running_on_ec2(self):
+        if self._running_on_ec2 is None:
+            with self._lock:
+                if self._running_on_ec2 is None:
+                    override = _env_flag('RUNNING_ON_EC2')
+                    self._running_on_ec2 = is_running_on_ec2() if override is None else override
+                    logger.info(f"Running on EC2: {self._running_on_ec2}")
+        return self._running_on_ec2
+
+    @property
+    def source(self):
+        source = os.getenv('DB_CONFIG_SOURCE') or ('ssm' if self.running_on_ec2 else 'local')
+        if source not in CONFIG_SOURCES:
+            raise ValueError(f"DB_CONFIG_SOURCE must be one of {', '.join(CONFIG_SOURCES)}")
+        return source
+
+    @property
+    def db_schema(self):
+        return os.getenv('DB_SCHEMA') or ('public' if self.running_on_ec2 else 'news_data')
+
+    @property
+    def log_level(self):
+        return os.getenv('LOG_LEVEL', 'INFO').upper()
+
+    @property
+    def log_levels(self):
+        """Logger name -> level name, from LOG_LEVELS."""
+        levels = {}
+        for item in filter(None, os.getenv('LOG_LEVELS', '').split(',')):
+            name, _, level = item.partition('=')
+            levels[name.strip()] = level.strip().upper()
+        return levels
+
+    @property
+    def conn_info(self):
+        """Connection keyword arguments for psycopg."""
+        return self.credentials()[0]
+
+    @property
+    def credentials_version(self):
+        """Number of times the connection info changed since it was first loaded."""
+        return self.credentials()[1]
+
+    def credentials(self):
+        """
+        Returns the connection info and its version together, loading it on first use.
+
+        Returns:
+            tuple: (conn_info dict, credentials_version).
+        """
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = (self._load_conn_info() or {}, 0)
+                    self._loaded_at = time.monotonic()
+                    self._start_refresher()
+        return self._credentials
+
+    def refresh_conn_info(self, min_interval=0.):
+        """
+        Re-reads the connection info, keeping the current one if the read fails.
+
+        Args:
+            min_interval (float): Skip the read if the last one was less than this many seconds ago.
+
+        Returns:
+            bool: Whether the connection info changed.
+        """
+        with self._lock:
+            if self._credentials is not None and time.monotonic() - self._loaded_at < min_interval:
+                return False
+            self._loaded_at = time.monotonic()
+        conn_info = self._load_conn_info()  # Outside the lock, so SSM latency doesn't block readers
+        if not conn_info:
+            logger.warning("Failed to refresh database connection info, keeping the current one")
+            return False
+        with self._lock:
+            current, version = self.credentials()
+            if conn_info == current:
+                return False
+            self._credentials = (conn_info, version + 1)
+        logger.info(f"Database connection info changed (version {version + 1})")
+        return True
+
+    def _start_refresher(self):
+        """Starts the background thread that re-reads SSM credentials every CREDENTIALS_TTL seconds."""
+        if self._refresher is not None or CREDENTIALS_TTL <= 0 or self.source != 'ssm':
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name='credentials-refresh', daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(CREDENTIALS_TTL)
+            try:
+                self.refresh_conn_info()
+            except Exception as e:
+                logger.exception(f"Credentials refresh failed: {e}")
+
+    def _load_conn_info(self):
+        source = self.source
+        logger.info(f"Loading database connection info from {source}")
+        if source == 'env':
+            conn_info = {
+                'host': os.getenv('DB_HOST'),
+                'port': os.getenv('DB_PORT', 5432),
+                'user': os.getenv('DB_USER'),
+                'password': os.getenv('DB_PASSWORD'),
+                'dbname': os.getenv('DB_NAME'),
+            }
+            return {key: value for key, value in conn_info.items() if value is not None}
+        if source == 'ssm':
+            fetched = fetch_db_credentials()
+            if not fetched:
+                return None
+            return {
+                'host': fetched.get('db_host'),
+                'port': fetched.get('db_port', 5432),
+                'user': fetched.get('db_user'),
+                'password': fetched.get('db_password'),
+                # 'dbname': fetched.get('db_name')
+            }
+        from credentials import postgres_db as postgres_credentials
+        return dict(postgres_credentials.__dict__)
+
+
+config = Config()
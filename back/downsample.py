@@ -0,0 +1,80 @@
+import numpy as np
+
+# Fields a row needs to be downsampled, and to still be clickable through to its article
+DOWNSAMPLE_FIELDS = ('article_id', 'time_published', 'sentiment_score')
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-triangle-three-buckets: picks up to max_points points that keep the visual shape of the series.
+
+    The first and last points are kept, and the inner points are split into max_points - 2 buckets. From each bucket,
+    the point forming the largest triangle with the previously kept point and the next bucket's average is kept.
+    The global minimum and maximum of y are always kept as well, so the result can have two more points.
+
+    Args:
+        x (np.ndarray): Ascending x values.
+        y (np.ndarray): The y values.
+        max_points (int): Number of points to keep (at least 3).
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+
+    x = x.astype(float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    # Average of each bucket, and of the last point as the bucket after the last one
+    sizes = np.append(ends - starts, 1)
+    mean_x = np.append(np.add.reduceat(x[:-1], starts), x[-1]) / sizes
+    mean_y = np.append(np.add.reduceat(y[:-1], starts), y[-1]) / sizes
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        areas = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return np.union1d(selected, [np.argmin(y), np.argmax(y)])
+
+
+def _series_indices(times, scores, max_points):
+    """LTTB indices of a (time_published, sentiment_score) series; missing scores count as 0."""
+    x = np.array(times, dtype='datetime64[us]').astype(np.int64)
+    y = np.nan_to_num(np.array(scores, dtype=float))
+    return lttb_indices(x, y, max_points)
+
+
+def downsample_rows(rows, max_points):
+    """
+    Reduces time-sorted rows to about max_points with LTTB on (time_published, sentiment_score).
+
+    Missing sentiment scores count as 0. Rows are kept whole, so each retained point keeps its article_id.
+
+    Returns:
+        list: The retained rows, in time order.
+    """
+    if len(rows) <= max_points:
+        return rows
+    indices = _series_indices([row['time_published'] for row in rows], [row['sentiment_score'] for row in rows], max_points)
+    return [rows[i] for i in indices]
+
+
+def downsample_columns(columns, max_points):
+    """
+    downsample_rows for columns (name -> list of values, see fetch_ticker_columns), keeping every column's values at
+    the retained points.
+
+    Returns:
+        dict: The columns of the retained points, in time order.
+    """
+    if len(columns['time_published']) <= max_points:
+        return columns
+    indices = _series_indices(columns['time_published'], columns['sentiment_score'], max_points)
+    return {name: [values[i] for i in indices] for name, values in columns.items()}
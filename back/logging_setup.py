@@ -0,0 +1,83 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from config import config
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+# INFO and lower records allowed per call site and LOG_RATE_INTERVAL seconds (0 disables the limit)
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))
+LOG_RATE_INTERVAL = float(os.getenv('LOG_RATE_INTERVAL', 10))
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Passes at most limit INFO/DEBUG records per call site (logging statement) and interval, so per-request messages
+    can't flood the log under load. Warnings and errors always pass. The first record of the next interval notes how
+    many were dropped.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # (pathname, lineno) -> [window start, records passed, records dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.interval:
+                if window[1] >= self.limit:
+                    window[2] += 1
+                    return False
+                window[1] += 1
+                return True
+            self._windows[key] = [now, 1, 0]
+            dropped = window[2] if window is not None else 0
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def setup_logging():
+    """
+    Routes all logging through a queue to a background thread that formats and writes to LOG_FILE and the console.
+
+    Request threads only filter and enqueue records, so file I/O and formatting stay off the request path. Levels
+    come from config (LOG_LEVEL, LOG_LEVELS) and repeated INFO/DEBUG records are rate limited (see RateLimitFilter).
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+        root = logging.getLogger()
+        root.addHandler(queue_handler)
+        root.setLevel(config.log_level)
+        for name, level in config.log_levels.items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # Flushes the records still queued
@@ -0,0 +1,146 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Upper bounds in seconds, from sub-millisecond cache hits to multi-second cold range queries
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+# Name of the API endpoint being served, set per request by the Flask and ASGI apps, so the database layer can label
+# what it records without having the endpoint passed down
+endpoint = ContextVar('endpoint', default='none')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Counter:
+    """A monotonically increasing value per combination of label values."""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labels, label_values)} {value}' for label_values, value in values)
+        return lines
+
+
+class Histogram:
+    """
+    Counts of observed values in fixed buckets, plus their sum and count, per combination of label values.
+
+    An observation is one bisect and a few additions under a lock; buckets are only made cumulative when rendered.
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # Label values -> [count per bucket..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((label_values, list(counts)) for label_values, counts in self._series.items())
+        for label_values, counts in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {counts[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+stage_seconds = Histogram('sentiment_stage_seconds',
+                          'Time spent per request stage: db_acquire, db_execute, db_fetch, encode, compress, handler, '
+                          'send and total.', ('endpoint', 'stage'))
+rows_returned = Counter('sentiment_rows_returned_total', 'Rows read from the database.', ('endpoint',))
+response_bytes = Counter('sentiment_response_bytes_total', 'Response body bytes sent, after compression.', ('endpoint',))
+requests_total = Counter('sentiment_requests_total', 'Requests served.', ('endpoint', 'status'))
+METRICS = (stage_seconds, rows_returned, response_bytes, requests_total)
+
+
+def observe(stage, seconds):
+    """Records seconds spent in a stage of the current endpoint's request."""
+    stage_seconds.observe(seconds, endpoint.get(), stage)
+
+
+@contextmanager
+def timed(stage):
+    """Times the enclosed block as a stage of the current endpoint's request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def record_query(acquire, execute, fetch, rows):
+    """Records the stages of one database query: pool checkout, execution and row building, and the rows it read."""
+    name = endpoint.get()
+    stage_seconds.observe(acquire, name, 'db_acquire')
+    stage_seconds.observe(execute, name, 'db_execute')
+    stage_seconds.observe(fetch, name, 'db_fetch')
+    rows_returned.inc(rows, name)
+
+
+def count_rows(rows):
+    """Adds rows read outside record_query (e.g. streamed chunks) to the current endpoint's count."""
+    rows_returned.inc(rows, endpoint.get())
+
+
+def record_request(name, status, handler, total, size):
+    """
+    Records one served request.
+
+    Args:
+        name (str): Endpoint name.
+        status (int): Response status code.
+        handler (float): Seconds until the response was ready to send.
+        total (float): Seconds until the response was fully sent.
+        size (int): Response body bytes.
+    """
+    stage_seconds.observe(handler, name, 'handler')
+    stage_seconds.observe(total - handler, name, 'send')
+    stage_seconds.observe(total, name, 'total')
+    response_bytes.inc(size, name)
+    requests_total.inc(1, name, str(status))
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    return ('\n'.join(line for metric in METRICS for line in metric.render()) + '\n').encode()
@@ -1,83 +1,646 @@
+import asyncio
+import atexit
+import base64
+import binascii
+import json
 import logging
+import re
+import threading
+import time
 import psycopg
 from psycopg.rows import dict_row
+from psycopg.rows import tuple_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
 import os
-import requests
-import boto3
-from botocore.exceptions import ClientError
+from datetime import datetime
+from typing import NamedTuple
+from config import CREDENTIALS_RETRY_INTERVAL, config
+import metrics
+from query_registry import QueryRegistry
 
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Logging is configured by the entry point (see logging_setup)
 logger = logging.getLogger(__name__)
 
 
-# def get_region_from_metadata():
-#     try:
-#         response = requests.get('http://169.254.169.254/latest/meta-data/placement/region')
-#         response.raise_for_status()
-#         print(f"Region: {response.text}")
-#         return response.text
-#     except requests.RequestException as e:
-#         print(f"Error fetching region from metadata: {e}")
-#         return None
-#
-# print('REGION', get_region_from_metadata())
-
-def is_running_on_ec2():
-    """Check if the code is running on an EC2 instance."""
-    try:
-        response = requests.get('http://169.254.169.254/latest/meta-data/', timeout=1)
-        if response.status_code in [200, 401]:
-            return True
-        else:
-            return False
-    except requests.RequestException:
+# Environment detection and credentials are resolved lazily, on first use of config (see config.py)
+def __getattr__(name):
+    if name in ('db_schema', 'conn_info', 'running_on_ec2'):
+        return getattr(config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Connection pool settings, overridable through the environment
+pool_config = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 5)),
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),  # Seconds before an idle connection above min_size is closed
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),  # Seconds before a connection is recycled
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),  # Seconds to wait for a free connection
+}
+
+_pool = None
+_pool_version = None  # config.credentials_version the pool was opened with
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, opening it on first use and reopening it when the credentials change."""
+    global _pool, _pool_version
+    if _pool is None or _pool_version != config.credentials_version:
+        with _pool_lock:
+            conn_info, version = config.credentials()
+            if _pool is None or _pool_version != version:
+                stale = _pool
+                _pool = ConnectionPool(
+                    kwargs=conn_info,
+                    name='sentiment',
+                    check=ConnectionPool.check_connection,  # Health check on every checkout
+                    open=True,
+                    **pool_config
+                )
+                _pool_version = version
+                logger.info(f"Opened connection pool with config: {pool_config} (credentials version {version})")
+                if stale is not None:
+                    stale.close()  # Connections still checked out are closed when returned
+    return _pool
+
+
+def close_pool():
+    """Close the connection pool, if it was opened."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(close_pool)
+
+_async_pool = None
+_async_pool_version = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool():
+    """Return the process-wide asyncio connection pool (psycopg.AsyncConnection), (re)opening it like get_pool."""
+    global _async_pool, _async_pool_version
+    if _async_pool is None or _async_pool_version != config.credentials_version:
+        async with _async_pool_lock:
+            conn_info, version = await asyncio.to_thread(config.credentials)  # The first load may call SSM
+            if _async_pool is None or _async_pool_version != version:
+                stale = _async_pool
+                pool = AsyncConnectionPool(
+                    kwargs=conn_info,
+                    name='sentiment-async',
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                    **pool_config
+                )
+                await pool.open()
+                _async_pool, _async_pool_version = pool, version
+                logger.info(f"Opened async connection pool with config: {pool_config} (credentials version {version})")
+                if stale is not None:
+                    await stale.close()
+    return _async_pool
+
+
+async def close_async_pool():
+    """Close the asyncio connection pool, if it was opened."""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            await _async_pool.close()
+            _async_pool = None
+
+
+def pool_stats():
+    """
+    Returns the connection pool configuration and usage counters.
+
+    Returns:
+        dict: Pool config plus the counters reported by psycopg_pool for the sync and, if used, the async pool
+        (empty if a pool is not open).
+    """
+    stats = _pool.get_stats() if _pool is not None else {}
+    async_stats = _async_pool.get_stats() if _async_pool is not None else {}
+    return {'config': pool_config, 'open': _pool is not None, 'stats': stats, 'async_open': _async_pool is not None,
+            'async_stats': async_stats, 'credentials_version': _pool_version}
+
+
+# Callables run after data is (re)loaded through this module, e.g. to drop response caches
+data_loaded_listeners = []
+
+
+def notify_data_loaded():
+    for listener in data_loaded_listeners:
+        listener()
+
+
+# The distinct (ticker, day, kind, value) facets of one all_news row, {row} being NEW, OLD or a table alias
+_FACETS_OF = """
+    SELECT DISTINCT s->>'ticker' AS ticker, {row}.time_published::date AS day, f.kind, f.value
+    FROM json_array_elements({row}.ticker_sentiment) s,
+        (SELECT 'source', {row}.source UNION ALL SELECT 'topic', t->>'topic' FROM json_array_elements({row}.topics) t) f(kind, value)
+    WHERE f.value IS NOT NULL
+"""
+
+
+# The distinct (ticker, day) pairs of a set of all_news rows, {rows} being a transition table
+_DAYS_OF = """
+    SELECT DISTINCT s->>'ticker' AS ticker, r.time_published::date AS day
+    FROM {rows} r, json_array_elements(r.ticker_sentiment) s
+"""
+# Per-day aggregates of ticker_sentiment rows, the source of ticker_daily_sentiment
+_DAILY_AGGREGATES = """
+    count(*), count(ts.sentiment_score), sum(ts.sentiment_score), sum(ts.sentiment_score * ts.relevance_score),
+    sum(ts.relevance_score), min(ts.sentiment_score), max(ts.sentiment_score)
+"""
+_DAILY_COLUMNS = "count, sentiment_count, sum_sentiment, sum_weighted_sentiment, sum_relevance, min_sentiment, max_sentiment"
+
+
+def setup_derived_tables(rebuild=False):
+    """
+    Creates the tables derived from all_news and the trigger that keeps them in sync on insert/update/delete.
+
+    Safe to re-run. After a bulk load that bypasses the trigger (e.g. pg_restore of all_news), call with rebuild=True.
+
+    Args:
+        rebuild (bool): Repopulate the derived tables from all_news.
+    """
+    statements = [
+        # Stable id to link derived rows back to their article
+        f"ALTER TABLE {config.db_schema}.all_news ADD COLUMN IF NOT EXISTS article_id bigint GENERATED BY DEFAULT AS IDENTITY",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS all_news_article_id_idx ON {config.db_schema}.all_news (article_id)",
+        # One row per (article, ticker) exploded from all_news.ticker_sentiment
+        f"""
+        CREATE TABLE IF NOT EXISTS {config.db_schema}.ticker_sentiment (
+            article_id bigint NOT NULL,
+            ticker text NOT NULL,
+            relevance_score double precision,
+            sentiment_score double precision,
+            time_published timestamp NOT NULL,
+            PRIMARY KEY (article_id, ticker)
+        )
+        """,
+        f"""
+        CREATE INDEX IF NOT EXISTS ticker_sentiment_ticker_time_idx
+        ON {config.db_schema}.ticker_sentiment (ticker, time_published) INCLUDE (relevance_score, sentiment_score)
+        """,
+        # Answers the topics= filter's containment tests
+        f"CREATE INDEX IF NOT EXISTS all_news_topics_idx ON {config.db_schema}.all_news USING gin ((topics::jsonb) jsonb_path_ops)",
+        f"""
+        CREATE OR REPLACE FUNCTION {config.db_schema}.sync_ticker_sentiment() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {config.db_schema}.ticker_sentiment WHERE article_id = OLD.article_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {config.db_schema}.ticker_sentiment (article_id, ticker, relevance_score, sentiment_score, time_published)
+                SELECT NEW.article_id, s->>'ticker', (s->>'relevance_score')::float, (s->>'ticker_sentiment_score')::float, NEW.time_published
+                FROM json_array_elements(NEW.ticker_sentiment) s
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS all_news_sync_ticker_sentiment ON {config.db_schema}.all_news",
+        f"""
+        CREATE TRIGGER all_news_sync_ticker_sentiment
+        AFTER INSERT OR UPDATE OF ticker_sentiment, time_published OR DELETE ON {config.db_schema}.all_news
+        FOR EACH ROW EXECUTE FUNCTION {config.db_schema}.sync_ticker_sentiment()
+        """,
+        # Article counts per (ticker, day) for each source and topic, for the filter facets
+        f"""
+        CREATE TABLE IF NOT EXISTS {config.db_schema}.ticker_facets (
+            ticker text NOT NULL,
+            day date NOT NULL,
+            kind text NOT NULL,
+            value text NOT NULL,
+            count integer NOT NULL,
+            PRIMARY KEY (ticker, day, kind, value)
+        )
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {config.db_schema}.sync_ticker_facets() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE {config.db_schema}.ticker_facets f SET count = f.count - 1
+                FROM ({_FACETS_OF.format(row='OLD')}) o
+                WHERE f.ticker = o.ticker AND f.day = o.day AND f.kind = o.kind AND f.value = o.value;
+                DELETE FROM {config.db_schema}.ticker_facets
+                WHERE ticker IN (SELECT s->>'ticker' FROM json_array_elements(OLD.ticker_sentiment) s)
+                    AND day = OLD.time_published::date AND count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {config.db_schema}.ticker_facets (ticker, day, kind, value, count)
+                SELECT ticker, day, kind, value, 1 FROM ({_FACETS_OF.format(row='NEW')}) n
+                ON CONFLICT (ticker, day, kind, value) DO UPDATE SET count = {config.db_schema}.ticker_facets.count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS all_news_sync_ticker_facets ON {config.db_schema}.all_news",
+        f"""
+        CREATE TRIGGER all_news_sync_ticker_facets
+        AFTER INSERT OR UPDATE OF ticker_sentiment, time_published, source, topics OR DELETE ON {config.db_schema}.all_news
+        FOR EACH ROW EXECUTE FUNCTION {config.db_schema}.sync_ticker_facets()
+        """,
+        # Daily rollup of ticker_sentiment (rows with relevance_score > 0), for day and week buckets
+        f"""
+        CREATE TABLE IF NOT EXISTS {config.db_schema}.ticker_daily_sentiment (
+            ticker text NOT NULL,
+            day date NOT NULL,
+            count integer NOT NULL,
+            sentiment_count integer NOT NULL,
+            sum_sentiment double precision,
+            sum_weighted_sentiment double precision,
+            sum_relevance double precision,
+            min_sentiment double precision,
+            max_sentiment double precision,
+            PRIMARY KEY (ticker, day)
+        )
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {config.db_schema}.refresh_ticker_daily_sentiment(tickers text[], days date[]) RETURNS void AS $$
+        BEGIN
+            DELETE FROM {config.db_schema}.ticker_daily_sentiment d
+            USING unnest(tickers, days) AS t(ticker, day)
+            WHERE d.ticker = t.ticker AND d.day = t.day;
+            INSERT INTO {config.db_schema}.ticker_daily_sentiment (ticker, day, {_DAILY_COLUMNS})
+            SELECT t.ticker, t.day, {_DAILY_AGGREGATES}
+            FROM unnest(tickers, days) AS t(ticker, day)
+            JOIN {config.db_schema}.ticker_sentiment ts
+                ON ts.ticker = t.ticker AND ts.time_published >= t.day AND ts.time_published < t.day + 1
+            WHERE ts.relevance_score > 0
+            GROUP BY t.ticker, t.day
+            -- A concurrent load may have refreshed the same day since our delete
+            ON CONFLICT (ticker, day) DO UPDATE SET
+                count = EXCLUDED.count, sentiment_count = EXCLUDED.sentiment_count, sum_sentiment = EXCLUDED.sum_sentiment,
+                sum_weighted_sentiment = EXCLUDED.sum_weighted_sentiment, sum_relevance = EXCLUDED.sum_relevance,
+                min_sentiment = EXCLUDED.min_sentiment, max_sentiment = EXCLUDED.max_sentiment;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Once per statement, after the row triggers have synced ticker_sentiment, recompute only the touched days
+        f"""
+        CREATE OR REPLACE FUNCTION {config.db_schema}.sync_ticker_daily_sentiment() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM {config.db_schema}.refresh_ticker_daily_sentiment(array_agg(ticker), array_agg(day))
+                FROM ({_DAYS_OF.format(rows='new_rows')}) d;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM {config.db_schema}.refresh_ticker_daily_sentiment(array_agg(ticker), array_agg(day))
+                FROM ({_DAYS_OF.format(rows='old_rows')}) d;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Transition tables allow a single event per trigger
+        *[f"DROP TRIGGER IF EXISTS all_news_daily_sentiment_{event} ON {config.db_schema}.all_news" for event in ('insert', 'update', 'delete')],
+        f"""
+        CREATE TRIGGER all_news_daily_sentiment_insert AFTER INSERT ON {config.db_schema}.all_news
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {config.db_schema}.sync_ticker_daily_sentiment()
+        """,
+        f"""
+        CREATE TRIGGER all_news_daily_sentiment_update AFTER UPDATE ON {config.db_schema}.all_news
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {config.db_schema}.sync_ticker_daily_sentiment()
+        """,
+        f"""
+        CREATE TRIGGER all_news_daily_sentiment_delete AFTER DELETE ON {config.db_schema}.all_news
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {config.db_schema}.sync_ticker_daily_sentiment()
+        """,
+        # Single-row counter bumped by every statement that writes all_news, for cheap change detection
+        f"""
+        CREATE TABLE IF NOT EXISTS {config.db_schema}.data_version (
+            id boolean PRIMARY KEY DEFAULT true CHECK (id),
+            version bigint NOT NULL DEFAULT 0,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        )
+        """,
+        f"INSERT INTO {config.db_schema}.data_version DEFAULT VALUES ON CONFLICT DO NOTHING",
+        f"""
+        CREATE OR REPLACE FUNCTION {config.db_schema}.bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE {config.db_schema}.data_version SET version = version + 1, updated_at = now();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS all_news_bump_data_version ON {config.db_schema}.all_news",
+        f"""
+        CREATE TRIGGER all_news_bump_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {config.db_schema}.all_news
+        FOR EACH STATEMENT EXECUTE FUNCTION {config.db_schema}.bump_data_version()
+        """,
+    ]
+    if rebuild:
+        statements += [
+            f"TRUNCATE {config.db_schema}.ticker_sentiment",
+            f"""
+            INSERT INTO {config.db_schema}.ticker_sentiment (article_id, ticker, relevance_score, sentiment_score, time_published)
+            SELECT n.article_id, s->>'ticker', (s->>'relevance_score')::float, (s->>'ticker_sentiment_score')::float, n.time_published
+            FROM {config.db_schema}.all_news n, json_array_elements(n.ticker_sentiment) s
+            ON CONFLICT DO NOTHING
+            """,
+            f"ANALYZE {config.db_schema}.ticker_sentiment",
+            f"TRUNCATE {config.db_schema}.ticker_facets",
+            f"""
+            INSERT INTO {config.db_schema}.ticker_facets (ticker, day, kind, value, count)
+            SELECT f.ticker, f.day, f.kind, f.value, count(*)
+            FROM {config.db_schema}.all_news n, LATERAL ({_FACETS_OF.format(row='n')}) f
+            GROUP BY 1, 2, 3, 4
+            """,
+            f"ANALYZE {config.db_schema}.ticker_facets",
+            f"TRUNCATE {config.db_schema}.ticker_daily_sentiment",
+            f"""
+            INSERT INTO {config.db_schema}.ticker_daily_sentiment (ticker, day, {_DAILY_COLUMNS})
+            SELECT ts.ticker, ts.time_published::date, {_DAILY_AGGREGATES}
+            FROM {config.db_schema}.ticker_sentiment ts
+            WHERE ts.relevance_score > 0
+            GROUP BY 1, 2
+            """,
+            f"ANALYZE {config.db_schema}.ticker_daily_sentiment",
+        ]
+    # all_news may have been reloaded without the trigger in place (e.g. pg_restore)
+    statements.append(f"UPDATE {config.db_schema}.data_version SET version = version + 1, updated_at = now()")
+
+    with get_pool().connection() as conn:
+        for statement in statements:
+            conn.execute(statement)
+    logger.info(f"Derived tables set up in schema {config.db_schema} (rebuild={rebuild})")
+    if rebuild:
+        notify_data_loaded()
+
+
+# Selectable response fields and the column each one reads
+SENTIMENT_FIELDS = {
+    'article_id': 'ts.article_id',
+    'relevance_score': 'ts.relevance_score',
+    'sentiment_score': 'ts.sentiment_score',
+    'time_published': 'ts.time_published',
+    'source': 'n.source',
+    'authors': 'n.authors',
+    'url': 'n.url',
+    'title': 'n.title',
+    'summary': 'n.summary',
+    'overall_sentiment_score': 'n.overall_sentiment_score',
+    'tickers_json': 'n.ticker_sentiment',
+    'topics_json': 'n.topics',
+}
+DEFAULT_FIELDS = ('article_id', 'time_published', 'sentiment_score', 'relevance_score', 'source', 'url')
+# The per-ticker fields; the others describe the article itself and are the same for each of its tickers
+SERIES_FIELDS = ('article_id', 'sentiment_score', 'relevance_score')
+ARTICLE_FIELDS = {'article_id': 'n.article_id', 'time_published': 'n.time_published',
+                  **{f: column for f, column in SENTIMENT_FIELDS.items() if column.startswith('n.')}}
+# Casts that give every field a flat scalar type for columnar (Arrow) output
+COLUMNAR_CASTS = {'authors': 'text', 'overall_sentiment_score': 'float8', 'tickers_json': 'text', 'topics_json': 'text'}
+
+
+def resolve_fields(fields_param):
+    """
+    Parses a comma-separated fields parameter against SENTIMENT_FIELDS.
+
+    Args:
+        fields_param (str): e.g. 'time_published,sentiment_score,title', 'all', or None for DEFAULT_FIELDS.
+
+    Returns:
+        tuple: The selected field names, in SENTIMENT_FIELDS order.
+
+    Raises:
+        ValueError: On an unknown field name, or if the parameter names no field.
+    """
+    if not fields_param:
+        return DEFAULT_FIELDS
+    if fields_param == 'all':
+        return tuple(SENTIMENT_FIELDS)
+    requested = {f.strip() for f in fields_param.split(',') if f.strip()}
+    if not requested:
+        raise ValueError('No fields selected')
+    unknown = requested - SENTIMENT_FIELDS.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(f for f in SENTIMENT_FIELDS if f in requested)
+
+
+class SentimentFilters(NamedTuple):
+    """Article filters applied in SQL: sources to keep or drop, and topics to keep (at a minimum topic relevance)."""
+    sources: tuple = ()
+    exclude_sources: tuple = ()
+    topics: tuple = ()
+    topic_relevance: float = 0.
+
+    @property
+    def active(self):
+        return bool(self.sources or self.exclude_sources or self.topics)
+
+    def conditions(self):
+        """
+        Returns:
+            tuple: (list of SQL conditions on all_news n, list of their parameters in order).
+        """
+        conditions, params = [], []
+        if self.sources:
+            conditions.append('n.source = ANY(%s)')
+            params.append(list(self.sources))
+        if self.exclude_sources:
+            conditions.append('n.source <> ALL(%s)')
+            params.append(list(self.exclude_sources))
+        if self.topics:
+            # One containment test per topic, so each is answered by the GIN index on topics::jsonb
+            conditions.append(f"({' OR '.join(['n.topics::jsonb @> %s'] * len(self.topics))})")
+            params.extend(Jsonb([{'topic': topic}]) for topic in self.topics)
+            if self.topic_relevance > 0:
+                conditions.append("""EXISTS (
+            SELECT 1 FROM jsonb_array_elements(n.topics::jsonb) t
+            WHERE t->>'topic' = ANY(%s) AND (t->>'relevance_score')::float >= %s
+        )""")
+                params.extend([list(self.topics), self.topic_relevance])
+        return conditions, params
+
+
+NO_FILTERS = SentimentFilters()
+
+
+def _sentiment_query(ticker_filter, fields=DEFAULT_FIELDS, with_ticker=False, conditions=(), order_by='ts.time_published', limit=False,
+                     include_start=False, include_end=False, casts=None):
+    """
+    Builds the article-rows query for the given ticker predicate (single ticker or ANY) and projection.
+
+    all_news is only joined when a selected field, condition or sort key reads from it. The date range is open
+    unless include_start/include_end close it. casts maps field names to SQL types to cast them to.
+    Parameters are, in order: the ticker predicate's, relevance score, start date, end date, those of the extra
+    conditions, and the row limit when limit=True.
+    """
+    casts = casts or {}
+    columns = [f"{SENTIMENT_FIELDS[f]}{'::' + casts[f] if f in casts else ''} as {f}" for f in fields]
+    if with_ticker:
+        columns.insert(0, 'ts.ticker')
+    where = '\n        AND '.join([
+        ticker_filter,
+        'ts.relevance_score > %s',
+        f"ts.time_published {'>=' if include_start else '>'} %s",
+        f"ts.time_published {'<=' if include_end else '<'} %s",
+        *conditions,
+    ])
+    needs_article = any(re.search(r'\bn\.', expr) for expr in [*columns, *conditions, order_by])
+    join = f"JOIN {config.db_schema}.all_news n ON n.article_id = ts.article_id" if needs_article else ''
+    return f"""
+    SELECT 
+        {', '.join(columns)}
+    FROM 
+        {config.db_schema}.ticker_sentiment ts
+        {join}
+    WHERE 
+        {where}
+    ORDER BY {order_by}
+    {'LIMIT %s' if limit else ''};
+    """
+
+
+# Statements built once per shape and prepared per pooled connection, with per-statement counters
+queries = QueryRegistry(int(os.getenv('DB_MAX_STATEMENTS', 1024)))
+
+
+def query_stats():
+    """Returns execution counts and latency per registered query (see QueryRegistry.stats)."""
+    return queries.stats()
+
+
+class _Query:
+    """A statement, its parameters, and how to turn its rows into the result, runnable on the sync or the async pool."""
+
+    def __init__(self, statement, params, finish=None, row_factory=dict_row):
+        self.statement = statement
+        self.params = params
+        self.finish = finish or (lambda records: records)
+        self.row_factory = row_factory
+
+
+def _is_auth_error(error):
+    """
+    Whether a connection error may come from stale credentials: an authorization failure (SQLSTATE class 28), or a pool
+    timeout, since the pool retries failed connects in the background and only times out the waiting caller.
+    """
+    return (isinstance(error, PoolTimeout) or (error.sqlstate or '').startswith('28')
+            or 'authentication failed' in str(error))
+
+
+def _credentials_rotated(error):
+    """
+    On an error that may be an authentication failure, re-fetches the credentials once (at most every
+    CREDENTIALS_RETRY_INTERVAL seconds). If they changed, the pools are rebuilt on their next use.
+
+    Returns:
+        bool: Whether the credentials changed, i.e. whether the query is worth retrying.
+    """
+    if not _is_auth_error(error):
         return False
+    logger.warning(f"Possible authentication failure, re-reading credentials: {error}")
+    return config.refresh_conn_info(min_interval=CREDENTIALS_RETRY_INTERVAL)
 
 
-def fetch_db_credentials():
-    """Fetch database credentials from AWS Systems Manager Parameter Store."""
+def _fetch_all(statement, params, row_factory=dict_row, retry=True):
+    """
+    Runs a registered statement, prepared, on a pooled connection and returns all rows as dictionaries (None on error).
+
+    If the error may come from rotated credentials and re-reading them gives new ones, retries once on the rebuilt pool.
+    """
+    # logger.debug(f"Executing query: {statement.sql} with params: {params} on DB with host: {os.getenv('DB_HOST', None)}")
+    started = time.perf_counter()
     try:
-        ssm_client = boto3.client('ssm', region_name='il-central-1')
-        parameters = ssm_client.get_parameters(
-            Names=[
-                '/hybrid/config/db_host',
-                '/hybrid/config/db_port',
-                '/hybrid/config/db_user',
-                '/hybrid/config/db_password',
-                '/hybrid/config/db_name'
-            ],
-            WithDecryption=True
-        )
-        return {param['Name'].split('/')[-1]: param['Value'] for param in parameters['Parameters']}
-    except ClientError as e:
-        logger.error(f"Failed to fetch parameters: {e}")
-        return {}
+        with get_pool().connection() as conn:
+            acquired = time.perf_counter()
+            with conn.cursor(row_factory=row_factory) as cur:
+                cur.execute(statement.sql, params, prepare=True)
+                executed = time.perf_counter()
+                records = cur.fetchall()
+                fetched = time.perf_counter()
+        queries.record(statement, fetched - started)
+        metrics.record_query(acquired - started, executed - acquired, fetched - executed, len(records))
+        return records
+
+    except psycopg.OperationalError as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        if retry and _credentials_rotated(e):
+            return _fetch_all(statement, params, row_factory, retry=False)
+        logger.error(f"Database error: {e}")
+    except psycopg.Error as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        logger.error(f"Database error: {e}")
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred: {e}")
+
 
+async def _afetch_all(statement, params, row_factory=dict_row, retry=True):
+    """Async counterpart of _fetch_all, on the asyncio pool."""
+    started = time.perf_counter()
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            acquired = time.perf_counter()
+            async with conn.cursor(row_factory=row_factory) as cur:
+                await cur.execute(statement.sql, params, prepare=True)
+                executed = time.perf_counter()
+                records = await cur.fetchall()
+                fetched = time.perf_counter()
+        queries.record(statement, fetched - started)
+        metrics.record_query(acquired - started, executed - acquired, fetched - executed, len(records))
+        return records
+
+    except psycopg.OperationalError as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        if retry and await asyncio.to_thread(_credentials_rotated, e):
+            return await _afetch_all(statement, params, row_factory, retry=False)
+        logger.error(f"Database error: {e}")
+    except psycopg.Error as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        logger.error(f"Database error: {e}")
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred: {e}")
 
-running_on_ec2 = is_running_on_ec2()
 
+def _run(query):
+    records = _fetch_all(query.statement, query.params, query.row_factory)
+    return None if records is None else query.finish(records)
 
-if running_on_ec2:
-    # Use environment variables for the PostgreSQL credentials
-    fetched = fetch_db_credentials()
-    conn_info = {
-        'host': fetched.get('db_host'),
-        'port': fetched.get('db_port', 5432),
-        'user': fetched.get('db_user'),
-        'password': fetched.get('db_password'),
-        # 'dbname': fetched.get('db_name')
-    }
-else:
-    from credentials import postgres_db as postgres_credentials
-    conn_info = postgres_credentials.__dict__
 
-logger.info(f"Running on EC2: {running_on_ec2}")
-# logger.debug(f"Database connection info: {conn_info}")
+async def _arun(query):
+    records = await _afetch_all(query.statement, query.params, query.row_factory)
+    return None if records is None else query.finish(records)
 
 
-def fetch_ticker_data(ticker, start_date, end_date, relevance_score=0.):
+def _log_records(what, subject):
+    def finish(records):
+        if records:
+            logger.info(f"Fetched {len(records)} {what} for ticker {subject}")
+        else:
+            logger.warning(f"No data found for ticker {subject} with the given parameters.")
+        return records
+    return finish
+
+
+def _ticker_data_query(ticker, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, include_start=False, include_end=False,
+                       filters=NO_FILTERS):
+    conditions, filter_params = filters.conditions()
+    params = (ticker, relevance_score, start_date, end_date, *filter_params)
+    statement = queries.statement(
+        'ticker_data',
+        lambda: _sentiment_query('ts.ticker = %s', fields, conditions=conditions, include_start=include_start, include_end=include_end),
+        fields, tuple(conditions), include_start, include_end)
+    return _Query(statement, params, _log_records('records', ticker))
+
+
+def fetch_ticker_data(ticker, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, include_start=False, include_end=False,
+                      filters=NO_FILTERS):
     """
     Fetches ticker sentiment and relevance score within a specified date range.
 
@@ -86,50 +649,604 @@ def fetch_ticker_data(ticker, start_date, end_date, relevance_score=0.):
         start_date (str): The start date of the date range (format YYYY-MM-DD).
         end_date (str): The end date of the date range (format YYYY-MM-DD).
         relevance_score (float): The minimum relevance score to filter by (default = 0.35).
+        fields (tuple): Response fields to select (see SENTIMENT_FIELDS).
+        include_start (bool): Also return rows published exactly at start_date.
+        include_end (bool): Also return rows published exactly at end_date.
+        filters (SentimentFilters): Source and topic filters.
 
     Returns:
         list: A list of dictionaries containing the fetched data.
     """
-    sql_query = f"""
-    SELECT 
-        sentiment->>'relevance_score' as relevance_score, 
-        sentiment->>'ticker_sentiment_score' as sentiment_score, 
-        n.time_published, 
-        n.source,
-        n.authors,
-        n.url,
-        n.title,
-        n.summary,
-        n.overall_sentiment_score,
-        n.ticker_sentiment as tickers_json,
-        n.topics as topics_json
-        
-    FROM 
-        {'public' if running_on_ec2 else 'news_data'}.all_news n,
-        json_array_elements(n.ticker_sentiment) as sentiment
-    WHERE 
-        sentiment->>'ticker' = %s
-        AND (sentiment->>'relevance_score')::float > %s
-        AND n.time_published > %s
-        AND n.time_published < %s
-    ORDER BY n.time_published;
+    return _run(_ticker_data_query(ticker, start_date, end_date, relevance_score, fields, include_start, include_end, filters))
+
+
+async def afetch_ticker_data(*args, **kwargs):
+    """Async fetch_ticker_data."""
+    return await _arun(_ticker_data_query(*args, **kwargs))
+
+
+def _tickers_data_query(tickers, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, filters=NO_FILTERS):
+    def finish(records):
+        grouped = {ticker: [] for ticker in tickers}
+        for record in records:
+            grouped[record.pop('ticker')].append(record)
+        logger.info(f"Fetched {len(records)} records for tickers {', '.join(tickers)}")
+        return grouped
+
+    conditions, filter_params = filters.conditions()
+    params = (list(tickers), relevance_score, start_date, end_date, *filter_params)
+    statement = queries.statement('tickers_data', lambda: _sentiment_query('ts.ticker = ANY(%s)', fields, with_ticker=True, conditions=conditions),
+                                  fields, tuple(conditions))
+    return _Query(statement, params, finish)
+
+
+def fetch_tickers_data(tickers, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, filters=NO_FILTERS):
     """
-    params = (ticker, relevance_score, start_date, end_date)
-    # logger.debug(f"Executing query: {sql_query} with params: {params} on DB with host: {os.getenv('DB_HOST', None)}")
+    Fetches ticker sentiment rows for several tickers in a single query.
+
+    Args:
+        tickers (list): The ticker symbols to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+        fields (tuple): Response fields to select (see SENTIMENT_FIELDS).
+        filters (SentimentFilters): Source and topic filters.
+
+    Returns:
+        dict: Ticker -> list of row dictionaries (empty list for tickers without data), or None on a database error.
+    """
+    return _run(_tickers_data_query(tickers, start_date, end_date, relevance_score, fields, filters))
+
+
+async def afetch_tickers_data(*args, **kwargs):
+    """Async fetch_tickers_data."""
+    return await _arun(_tickers_data_query(*args, **kwargs))
+
+
+def _ticker_columns_query(tickers, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, with_ticker=False, filters=NO_FILTERS):
+    names = (['ticker'] if with_ticker else []) + list(fields)
+
+    def finish(records):
+        logger.info(f"Fetched {len(records)} columnar records for tickers {', '.join(tickers)}")
+        values = list(zip(*records)) if records else [()] * len(names)
+        return {name: list(column) for name, column in zip(names, values)}
+
+    conditions, filter_params = filters.conditions()
+    statement = queries.statement(
+        'ticker_columns',
+        lambda: _sentiment_query('ts.ticker = ANY(%s)', fields, with_ticker=with_ticker, conditions=conditions, casts=COLUMNAR_CASTS),
+        fields, with_ticker, tuple(conditions))
+    params = (list(tickers), relevance_score, start_date, end_date, *filter_params)
+    return _Query(statement, params, finish, row_factory=tuple_row)
+
 
+def fetch_ticker_columns(tickers, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, with_ticker=False, filters=NO_FILTERS):
+    """
+    Fetches ticker rows transposed into columns, with every field cast to a flat scalar type (see COLUMNAR_CASTS).
+
+    Rows are read as tuples, skipping per-row dictionaries, for building columnar formats such as Arrow.
+
+    Args:
+        tickers (list): The ticker symbols to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+        fields (tuple): Response fields to select (see SENTIMENT_FIELDS).
+        with_ticker (bool): Prepend a ticker column.
+        filters (SentimentFilters): Source and topic filters.
+
+    Returns:
+        dict: Column name -> list of values, or None on a database error.
+    """
+    return _run(_ticker_columns_query(tickers, start_date, end_date, relevance_score, fields, with_ticker, filters))
+
+
+async def afetch_ticker_columns(*args, **kwargs):
+    """Async fetch_ticker_columns."""
+    return await _arun(_ticker_columns_query(*args, **kwargs))
+
+
+def encode_cursor(record):
+    """Encodes the (time_published, url) sort key of a row as an opaque page cursor."""
+    key = json.dumps([record['time_published'].isoformat(), record['url']])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a page cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
     try:
-        with psycopg.connect(**conn_info) as conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(sql_query, params)
-                records = cur.fetchall()
+        time_published, url = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(time_published), url
+    except (TypeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _ticker_page_query(ticker, start_date, end_date, relevance_score=0., limit=1000, after=None, fields=DEFAULT_FIELDS, filters=NO_FILTERS):
+    def finish(records):
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_cursor = encode_cursor(records[-1])
+        logger.info(f"Fetched page of {len(records)} records for ticker {ticker}")
+        return records, next_cursor
+
+    fields = tuple(f for f in SENTIMENT_FIELDS if f in fields or f in ('time_published', 'url'))
+    conditions, filter_params = filters.conditions()
+    params = [ticker, relevance_score, start_date, end_date, *filter_params]
+    if after:
+        conditions.append('(ts.time_published, n.url) > (%s, %s)')
+        params.extend(decode_cursor(after))
+    params.append(limit + 1)  # One extra row tells whether there is a next page
+
+    statement = queries.statement(
+        'ticker_page',
+        lambda: _sentiment_query('ts.ticker = %s', fields, conditions=conditions, order_by='ts.time_published, n.url', limit=True),
+        fields, tuple(conditions))
+    return _Query(statement, params, finish)
+
+
+def fetch_ticker_page(ticker, start_date, end_date, relevance_score=0., limit=1000, after=None, fields=DEFAULT_FIELDS, filters=NO_FILTERS):
+    """
+    Fetches one page of ticker rows ordered by (time_published, url), resuming after a keyset cursor.
+
+    Args:
+        ticker (str): The ticker symbol to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+        limit (int): The page size.
+        after (str): Cursor returned with the previous page, or None for the first page.
+        fields (tuple): Response fields to select (time_published and url are always included for the cursor).
+        filters (SentimentFilters): Source and topic filters.
+
+    Returns:
+        tuple: (list of row dictionaries, cursor of the next page or None on the last page), or None on a database error.
+    """
+    return _run(_ticker_page_query(ticker, start_date, end_date, relevance_score, limit, after, fields, filters))
+
+
+async def afetch_ticker_page(*args, **kwargs):
+    """Async fetch_ticker_page."""
+    return await _arun(_ticker_page_query(*args, **kwargs))
+
 
-                if records:
-                    logger.info(f"Fetched {len(records)} records for ticker {ticker}")
-                else:
-                    logger.warning(f"No data found for ticker {ticker} with the given parameters.")
-                return records
+STREAM_CHUNK_SIZE = int(os.getenv('DB_STREAM_CHUNK_SIZE', 2000))
+
+
+def _stream_query(ticker, start_date, end_date, relevance_score, fields, filters):
+    conditions, filter_params = filters.conditions()
+    params = (ticker, relevance_score, start_date, end_date, *filter_params)
+    statement = queries.statement('ticker_stream', lambda: _sentiment_query('ts.ticker = %s', fields, conditions=conditions),
+                                  fields, tuple(conditions))
+    return statement, params
+
+
+def _stream_chunks(statement, params, chunk_size, ticker):
+    started = time.perf_counter()
+    total = 0
+    with get_pool().connection() as conn:
+        with conn.cursor(name='sentiment_stream', row_factory=dict_row) as cur:
+            cur.itersize = chunk_size
+            cur.execute(statement.sql, params)
+            while records := cur.fetchmany(chunk_size):
+                total += len(records)
+                metrics.count_rows(len(records))
+                yield records
+    queries.record(statement, time.perf_counter() - started)
+    logger.info(f"Streamed {total} records for ticker {ticker}")
+
+
+def _chunks_from(first, chunks):
+    if first is not None:
+        yield first
+        yield from chunks
+
+
+def iter_ticker_data(ticker, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, chunk_size=STREAM_CHUNK_SIZE,
+                     filters=NO_FILTERS, retry=True):
+    """
+    Streams the rows of fetch_ticker_data through a named server-side cursor, so memory stays bounded by one chunk.
+
+    The first chunk is fetched before returning, so connection and query errors are handled here as in _fetch_all
+    (including the retry on rotated credentials) rather than after the response has started. The pooled connection is
+    then held until the returned iterator is exhausted or closed.
+
+    Args:
+        ticker (str): The ticker symbol to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+        fields (tuple): Response fields to select (see SENTIMENT_FIELDS).
+        chunk_size (int): Rows fetched from the server per round trip.
+        filters (SentimentFilters): Source and topic filters.
+
+    Returns:
+        iterator: Chunks of up to chunk_size row dictionaries, or None on a database error.
+    """
+    statement, params = _stream_query(ticker, start_date, end_date, relevance_score, fields, filters)
+    chunks = _stream_chunks(statement, params, chunk_size, ticker)
+    started = time.perf_counter()
+    try:
+        return _chunks_from(next(chunks, None), chunks)
 
+    except psycopg.OperationalError as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        if retry and _credentials_rotated(e):
+            return iter_ticker_data(ticker, start_date, end_date, relevance_score, fields, chunk_size, filters, retry=False)
+        logger.error(f"Database error: {e}")
     except psycopg.Error as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
         logger.error(f"Database error: {e}")
     except Exception as e:
         logger.exception(f"An unexpected error occurred: {e}")
+
+
+async def _astream_chunks(statement, params, chunk_size, ticker):
+    started = time.perf_counter()
+    total = 0
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(name='sentiment_stream', row_factory=dict_row) as cur:
+            cur.itersize = chunk_size
+            await cur.execute(statement.sql, params)
+            while records := await cur.fetchmany(chunk_size):
+                total += len(records)
+                metrics.count_rows(len(records))
+                yield records
+    queries.record(statement, time.perf_counter() - started)
+    logger.info(f"Streamed {total} records for ticker {ticker}")
+
+
+async def _achunks_from(first, chunks):
+    if first is not None:
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+
+async def aiter_ticker_data(ticker, start_date, end_date, relevance_score=0., fields=DEFAULT_FIELDS, chunk_size=STREAM_CHUNK_SIZE,
+                            filters=NO_FILTERS, retry=True):
+    """Async iter_ticker_data, on an AsyncConnection from the asyncio pool: an async iterator of chunks, or None."""
+    statement, params = _stream_query(ticker, start_date, end_date, relevance_score, fields, filters)
+    chunks = _astream_chunks(statement, params, chunk_size, ticker)
+    started = time.perf_counter()
+    try:
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return _achunks_from(first, chunks)
+
+    except psycopg.OperationalError as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        if retry and await asyncio.to_thread(_credentials_rotated, e):
+            return await aiter_ticker_data(ticker, start_date, end_date, relevance_score, fields, chunk_size, filters,
+                                           retry=False)
+        logger.error(f"Database error: {e}")
+    except psycopg.Error as e:
+        queries.record(statement, time.perf_counter() - started, error=True)
+        logger.error(f"Database error: {e}")
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred: {e}")
+
+
+def _articles_query(article_ids, fields=tuple(ARTICLE_FIELDS)):
+    def finish(records):
+        logger.info(f"Fetched {len(records)} of {len(article_ids)} requested articles")
+        return {record['article_id']: record for record in records}
+
+    def build():
+        columns = [f"{ARTICLE_FIELDS[f]} as {f}" for f in ARTICLE_FIELDS if f == 'article_id' or f in fields]
+        return f"""
+        SELECT
+            {', '.join(columns)}
+        FROM
+            {config.db_schema}.all_news n
+        WHERE
+            n.article_id = ANY(%s);
+        """
+
+    return _Query(queries.statement('articles', build, tuple(fields)), (list(article_ids),), finish)
+
+
+def fetch_articles(article_ids, fields=tuple(ARTICLE_FIELDS)):
+    """
+    Fetches the detail of articles by id; by default every field, including the heavy summary, ticker sentiment and
+    topics columns.
+
+    Args:
+        article_ids (list): The article ids (as returned in the article_id field of sentiment rows).
+        fields (tuple): Article fields to select (see ARTICLE_FIELDS); article_id is always included.
+
+    Returns:
+        dict: Article id -> detail dictionary, for the ids that exist, or None on a database error.
+    """
+    return _run(_articles_query(article_ids, fields))
+
+
+async def afetch_articles(*args, **kwargs):
+    """Async fetch_articles."""
+    return await _arun(_articles_query(*args, **kwargs))
+
+
+DATA_VERSION_TTL = float(os.getenv('DATA_VERSION_TTL', 5))
+_data_version = {'version': None, 'checked': float('-inf')}
+_data_version_lock = threading.Lock()
+
+
+def _data_version_query():
+    statement = queries.statement('data_version', lambda: f"SELECT version FROM {config.db_schema}.data_version;")
+    return _Query(statement, (), lambda records: records[0]['version'] if records else None)
+
+
+def fetch_data_version():
+    """Returns the all_news data version counter, or None if it can't be read."""
+    return _run(_data_version_query())
+
+
+def _data_version_due():
+    """
+    Checks whether the cached data version is older than DATA_VERSION_TTL, marking it as being re-read if so.
+
+    Returns:
+        tuple: (cached version or None, whether the caller should re-read it from the database).
+    """
+    with _data_version_lock:
+        now = time.monotonic()
+        if now - _data_version['checked'] < DATA_VERSION_TTL:
+            return _data_version['version'], False
+        _data_version['checked'] = now
+        return _data_version['version'], True
+
+
+def _record_data_version(version):
+    with _data_version_lock:
+        changed = version is not None and _data_version['version'] not in (None, version)
+        if version is not None:
+            _data_version['version'] = version
+    if changed:
+        logger.info(f"Data version changed to {version}")
+        notify_data_loaded()
+    return version
+
+
+def current_data_version():
+    """
+    Returns the data version, re-reading it at most every DATA_VERSION_TTL seconds.
+
+    A change of version (data loaded by another process) runs the data_loaded_listeners.
+    """
+    version, due = _data_version_due()
+    return _record_data_version(fetch_data_version()) if due else version
+
+
+async def acurrent_data_version():
+    """Async current_data_version."""
+    version, due = _data_version_due()
+    return _record_data_version(await _arun(_data_version_query())) if due else version
+
+
+def _last_published_query(tickers, start_date, end_date, relevance_score=0.):
+    def build():
+        return f"""
+        SELECT greatest(
+            max(ts.time_published),
+            (SELECT updated_at AT TIME ZONE 'UTC' FROM {config.db_schema}.data_version)
+        ) as last_published
+        FROM {config.db_schema}.ticker_sentiment ts
+        WHERE
+            ts.ticker = ANY(%s)
+            AND ts.relevance_score > %s
+            AND ts.time_published > %s
+            AND ts.time_published < %s;
+        """
+    params = (list(tickers), relevance_score, start_date, end_date)
+    return _Query(queries.statement('last_published', build), params, lambda records: records[0]['last_published'] if records else None)
+
+
+def fetch_last_published(tickers, start_date, end_date, relevance_score=0.):
+    """
+    Returns the Last-Modified time of a sentiment query: the newest time_published among the rows it would return (an
+    index-only lookup), or the last data version change if that is later.
+
+    Source/topic filters are not applied: the unfiltered maximum bounds the filtered one, which is enough for
+    If-Modified-Since and Last-Modified. The data version time covers changes that leave the newest row in place, such
+    as backfilled older articles, re-scored sentiment or a rebuild of the derived tables.
+
+    Args:
+        tickers (list): The ticker symbols to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+
+    Returns:
+        datetime: The newest publication or data change time (UTC), or None on a database error.
+    """
+    return _run(_last_published_query(tickers, start_date, end_date, relevance_score))
+
+
+async def afetch_last_published(*args, **kwargs):
+    """Async fetch_last_published."""
+    return await _arun(_last_published_query(*args, **kwargs))
+
+
+BUCKET_INTERVALS = ('hour', 'day', 'week')
+# Buckets made of whole days, which ticker_daily_sentiment can answer
+ROLLUP_INTERVALS = ('day', 'week')
+
+
+def _at_midnight(date):
+    return not isinstance(date, datetime) or date.time() == datetime.min.time()
+
+
+def _uses_rollup(start_date, end_date, relevance_score, interval, filters):
+    """Whether the bucket query can be summed from ticker_daily_sentiment: whole days, no extra filtering."""
+    return interval in ROLLUP_INTERVALS and relevance_score == 0 and not filters.active and _at_midnight(start_date) and _at_midnight(end_date)
+
+
+def _ticker_buckets_query(ticker, start_date, end_date, relevance_score=0., interval='day', filters=NO_FILTERS):
+    if interval not in BUCKET_INTERVALS:
+        raise ValueError(f"interval must be one of {BUCKET_INTERVALS}")
+
+    if _uses_rollup(start_date, end_date, relevance_score, interval, filters):
+        # The range is open at its start, so the start day is aggregated from the per-article rows without those
+        # published exactly at midnight, and the rollup only supplies the following days
+        def build():
+            return f"""
+            WITH days AS (
+                SELECT d.day, {_DAILY_COLUMNS}
+                FROM {config.db_schema}.ticker_daily_sentiment d
+                WHERE
+                    d.ticker = %s
+                    AND d.day > %s::date
+                    AND d.day < %s::date
+                UNION ALL
+                SELECT ts.time_published::date, {_DAILY_AGGREGATES}
+                FROM {config.db_schema}.ticker_sentiment ts
+                WHERE
+                    ts.ticker = %s
+                    AND ts.relevance_score > 0
+                    AND ts.time_published > %s
+                    AND ts.time_published < %s::date + 1
+                    AND ts.time_published < %s
+                GROUP BY 1
+            )
+            SELECT
+                date_trunc(%s, day::timestamp) as bucket,
+                sum(count) as count,
+                sum(sum_sentiment) / NULLIF(sum(sentiment_count), 0) as mean_sentiment,
+                sum(sum_weighted_sentiment) / NULLIF(sum(sum_relevance), 0) as weighted_sentiment,
+                min(min_sentiment) as min_sentiment,
+                max(max_sentiment) as max_sentiment,
+                sum(sum_relevance) / sum(count) as mean_relevance
+            FROM days
+            GROUP BY 1
+            ORDER BY 1;
+            """
+        params = (ticker, start_date, end_date, ticker, start_date, start_date, end_date, interval)
+        return _Query(queries.statement('ticker_buckets_rollup', build), params, _log_records(f'{interval} buckets (daily rollup)', ticker))
+
+    conditions, filter_params = filters.conditions()
+
+    def build():
+        join = f"JOIN {config.db_schema}.all_news n ON n.article_id = ts.article_id" if conditions else ''
+        filter_where = ''.join(f"\n        AND {condition}" for condition in conditions)
+        return f"""
+        SELECT
+            date_trunc(%s, ts.time_published) as bucket,
+            count(*) as count,
+            avg(ts.sentiment_score) as mean_sentiment,
+            sum(ts.sentiment_score * ts.relevance_score) / NULLIF(sum(ts.relevance_score), 0) as weighted_sentiment,
+            min(ts.sentiment_score) as min_sentiment,
+            max(ts.sentiment_score) as max_sentiment,
+            avg(ts.relevance_score) as mean_relevance
+        FROM
+            {config.db_schema}.ticker_sentiment ts
+            {join}
+        WHERE
+            ts.ticker = %s
+            AND ts.relevance_score > %s
+            AND ts.time_published > %s
+            AND ts.time_published < %s{filter_where}
+        GROUP BY 1
+        ORDER BY 1;
+        """
+    params = (interval, ticker, relevance_score, start_date, end_date, *filter_params)
+    return _Query(queries.statement('ticker_buckets', build, tuple(conditions)), params, _log_records(f'{interval} buckets', ticker))
+
+
+def fetch_ticker_buckets(ticker, start_date, end_date, relevance_score=0., interval='day', filters=NO_FILTERS):
+    """
+    Aggregates ticker sentiment into time buckets in SQL.
+
+    Day and week buckets over whole days without a relevance threshold or filters are summed from the
+    ticker_daily_sentiment rollup instead of the per-article rows, except for the start day: the range excludes
+    its start, so that day is aggregated from the rows published after midnight, as the per-article query does.
+
+    Args:
+        ticker (str): The ticker symbol to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+        relevance_score (float): The minimum relevance score to filter by.
+        interval (str): Bucket width, one of BUCKET_INTERVALS.
+        filters (SentimentFilters): Source and topic filters.
+
+    Returns:
+        list: One dictionary per non-empty bucket with count, mean/weighted/min/max sentiment and mean relevance.
+    """
+    return _run(_ticker_buckets_query(ticker, start_date, end_date, relevance_score, interval, filters))
+
+
+async def afetch_ticker_buckets(*args, **kwargs):
+    """Async fetch_ticker_buckets."""
+    return await _arun(_ticker_buckets_query(*args, **kwargs))
+
+
+FACET_KINDS = ('source', 'topic')
+
+
+def _facets_query(tickers, start_date, end_date):
+    def finish(records):
+        facets = {f'{kind}s': [] for kind in FACET_KINDS}
+        for record in records:
+            facets[f"{record['kind']}s"].append({'value': record['value'], 'count': record['count']})
+        logger.info(f"Fetched {len(records)} facets for tickers {', '.join(tickers)}")
+        return facets
+
+    def build():
+        return f"""
+        SELECT kind, value, sum(count)::int as count
+        FROM {config.db_schema}.ticker_facets
+        WHERE
+            ticker = ANY(%s)
+            AND day >= %s::date
+            AND day < %s::date
+        GROUP BY kind, value
+        ORDER BY kind, count DESC, value;
+        """
+
+    return _Query(queries.statement('facets', build), (list(tickers), start_date, end_date), finish)
+
+
+def fetch_facets(tickers, start_date, end_date):
+    """
+    Returns the sources and topics of the tickers' articles with article counts, from the pre-aggregated ticker_facets.
+
+    Counts are per day, so the range is whole days: start_date's day through the day before end_date. Counts are
+    summed over the tickers, so an article about two of them counts twice.
+
+    Args:
+        tickers (list): The ticker symbols to query.
+        start_date (str): The start date of the date range (format YYYY-MM-DD).
+        end_date (str): The end date of the date range (format YYYY-MM-DD).
+
+    Returns:
+        dict: 'sources' and 'topics' -> list of {'value', 'count'}, most frequent first, or None on a database error.
+    """
+    return _run(_facets_query(tickers, start_date, end_date))
+
+
+async def afetch_facets(*args, **kwargs):
+    """Async fetch_facets."""
+    return await _arun(_facets_query(*args, **kwargs))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Database maintenance for the sentiment backend.')
+    parser.add_argument('--setup', action='store_true', help='Create derived tables, indexes and sync triggers.')
+    parser.add_argument('--rebuild', action='store_true', help='Repopulate derived tables from all_news (implies --setup).')
+    args = parser.parse_args()
+
+    from logging_setup import setup_logging
+    setup_logging()
+    if args.setup or args.rebuild:
+        setup_derived_tables(rebuild=args.rebuild)
+    else:
+        parser.print_help()
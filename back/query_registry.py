@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+
+
+class Statement:
+    """One built SQL statement, run as a server-side prepared statement, with its execution counters."""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.
+        self.max_time = 0.
+
+
+class QueryRegistry:
+    """
+    Builds each SQL statement once per name and shape, and records how often and how long each runs.
+
+    Statements are keyed by a name and the arguments their text depends on (selected fields, filter conditions, ...),
+    so the hot path only looks up a ready string instead of formatting it. Executing the same text with prepare=True
+    lets psycopg prepare it once per pooled connection, so the server skips parsing and planning on later calls.
+    Shapes come from client parameters, so at most max_statements are kept, evicting the least recently used.
+    Safe to share between the worker threads of one process.
+    """
+
+    def __init__(self, max_statements=1024):
+        self.max_statements = max_statements
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def statement(self, name, build, *shape):
+        """
+        Returns the statement for name and shape, building it on first use.
+
+        Args:
+            name (str): Name of the query, used to group the counters.
+            build (callable): Returns the SQL text; only called the first time a shape is seen.
+            *shape: Hashable arguments the SQL text depends on.
+
+        Returns:
+            Statement: The registered statement.
+        """
+        key = (name, *shape)
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is not None:
+                self._statements.move_to_end(key)
+                return statement
+            statement = self._statements[key] = Statement(name, build())
+            while len(self._statements) > self.max_statements:
+                self._statements.popitem(last=False)
+                self.evictions += 1
+        return statement
+
+    def record(self, statement, elapsed, error=False):
+        """Adds one execution taking elapsed seconds to the statement's counters."""
+        with self._lock:
+            statement.calls += 1
+            statement.errors += error
+            statement.total_time += elapsed
+            statement.max_time = max(statement.max_time, elapsed)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Query name -> number of built variants, calls, errors, and total/mean/max latency in milliseconds.
+        """
+        stats = {}
+        with self._lock:
+            for statement in self._statements.values():
+                entry = stats.setdefault(statement.name, {'variants': 0, 'calls': 0, 'errors': 0, 'total_ms': 0.,
+                                                          'max_ms': 0.})
+                entry['variants'] += 1
+                entry['calls'] += statement.calls
+                entry['errors'] += statement.errors
+                entry['total_ms'] += statement.total_time * 1000
+                entry['max_ms'] = max(entry['max_ms'], statement.max_time * 1000)
+        for entry in stats.values():
+            entry['mean_ms'] = entry['total_ms'] / entry['calls'] if entry['calls'] else 0.
+        return stats
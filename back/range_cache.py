@@ -0,0 +1,238 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import postgres_db as pgdb
+
+logger = logging.getLogger(__name__)
+
+# Columns every cached row needs so that ranges and thresholds can be re-applied in memory
+INDEX_FIELDS = ('time_published', 'relevance_score')
+# Rows whose deep size is measured to estimate a segment's size
+SIZE_SAMPLE_ROWS = 64
+
+
+def _deep_size(value):
+    """Approximate bytes held by a row value: the object plus, for lists and dicts, everything they contain."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(v) for v in value)
+    return size
+
+
+def estimate_size(rows):
+    """Approximate bytes held by row dictionaries, extrapolated from the deep size of an evenly spread sample."""
+    if not rows:
+        return 0
+    step = max(1, len(rows) // SIZE_SAMPLE_ROWS)
+    sample = rows[::step]
+    return sum(_deep_size(row) for row in sample) * len(rows) // len(sample)
+
+
+class _Segment:
+    """Rows of one ticker with start < time_published < end and relevance_score > threshold, sorted by time."""
+
+    def __init__(self, start, end, threshold, fields, rows):
+        self.start = start
+        self.end = end
+        self.threshold = threshold
+        self.fields = fields
+        self.rows = rows
+        self.times = np.array([row['time_published'] for row in rows], dtype='datetime64[us]')
+        self.relevance = np.array([row['relevance_score'] for row in rows], dtype=float)
+        self.size = estimate_size(rows) + self.times.nbytes + self.relevance.nbytes
+        self.created = time.monotonic()
+
+    def covers(self, start, end, threshold, fields):
+        return self.start <= start and end <= self.end and threshold >= self.threshold and set(fields) <= set(self.fields)
+
+    def extends_to(self, start, end, threshold, fields):
+        """Whether fetching only the missing edges would make this segment cover the query."""
+        return start <= self.end and self.start <= end and threshold >= self.threshold and set(fields) <= set(self.fields)
+
+    def select(self, start, end, threshold, fields):
+        lo = np.searchsorted(self.times, np.datetime64(start, 'us'), side='right')
+        hi = np.searchsorted(self.times, np.datetime64(end, 'us'), side='left')
+        indices = lo + np.flatnonzero(self.relevance[lo:hi] > threshold)
+        if tuple(fields) == self.fields:
+            return [self.rows[i] for i in indices]
+        return [{f: self.rows[i][f] for f in fields} for i in indices]
+
+
+class TickerRangeCache:
+    """
+    Per-ticker cache of time-sorted rows that answers narrower date ranges and higher relevance thresholds in memory.
+
+    A query that overlaps the cached range only fetches the missing edges from the database and widens the cached
+    segment. Queries with source/topic filters are cached as separate segments of the ticker. Total cached rows are
+    bounded by max_rows and their approximate size by max_bytes (wide fields such as summary or topics_json make rows
+    much larger), evicting least recently used segments.
+    """
+
+    def __init__(self, max_rows=200_000, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.size = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def get(self, ticker, start, end, threshold, fields, filters=pgdb.NO_FILTERS):
+        """Returns the rows for the query if the cached segment contains it, without touching the database."""
+        segment = self._segment((ticker, filters))
+        if segment is None or not segment.covers(start, end, threshold, fields):
+            return None
+        with self._lock:
+            self.hits += 1
+        return segment.select(start, end, threshold, fields)
+
+    def query(self, ticker, start, end, threshold, fields, filters=pgdb.NO_FILTERS):
+        """
+        Returns the rows for the query, fetching from the database only what the cached segment lacks.
+
+        Returns:
+            list: Row dictionaries with the requested fields, or None on a database error.
+        """
+        segment, fetches = self._plan(ticker, start, end, threshold, fields, filters)
+        fetched = {part: pgdb.fetch_ticker_data(*args, **kwargs) for part, (args, kwargs) in fetches.items()}
+        return self._complete((ticker, filters), segment, fetched, start, end, threshold, fields)
+
+    async def aquery(self, ticker, start, end, threshold, fields, filters=pgdb.NO_FILTERS):
+        """Async query, fetching the missing rows on the asyncio pool."""
+        segment, fetches = self._plan(ticker, start, end, threshold, fields, filters)
+        fetched = {part: await pgdb.afetch_ticker_data(*args, **kwargs) for part, (args, kwargs) in fetches.items()}
+        return self._complete((ticker, filters), segment, fetched, start, end, threshold, fields)
+
+    def query_many(self, tickers, start, end, threshold, fields, filters=pgdb.NO_FILTERS):
+        """
+        Answers several tickers at once; the ones not contained in their cached segment are fetched in one batch query.
+
+        Returns:
+            dict: Ticker -> row dictionaries with the requested fields, or None on a database error.
+        """
+        result, missing, fetch_fields = self._plan_many(tickers, start, end, threshold, fields, filters)
+        fetched = pgdb.fetch_tickers_data(missing, start, end, threshold, fetch_fields, filters) if missing else {}
+        return self._complete_many(result, fetched, start, end, threshold, fields, fetch_fields, filters)
+
+    async def aquery_many(self, tickers, start, end, threshold, fields, filters=pgdb.NO_FILTERS):
+        """Async query_many, fetching the missing tickers on the asyncio pool."""
+        result, missing, fetch_fields = self._plan_many(tickers, start, end, threshold, fields, filters)
+        fetched = await pgdb.afetch_tickers_data(missing, start, end, threshold, fetch_fields, filters) if missing else {}
+        return self._complete_many(result, fetched, start, end, threshold, fields, fetch_fields, filters)
+
+    def invalidate(self, ticker=None):
+        with self._lock:
+            if ticker is None:
+                self._segments.clear()
+                self.rows = 0
+                self.size = 0
+                return
+            for key in [k for k in self._segments if k[0] == ticker]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {'tickers': len({ticker for ticker, _ in self._segments}), 'segments': len(self._segments), 'rows': self.rows, 'max_rows': self.max_rows,
+                    'bytes': self.size, 'max_bytes': self.max_bytes, 'ttl': self.ttl,
+                    'hits': self.hits, 'partial_hits': self.partial_hits, 'misses': self.misses}
+
+    def _segment(self, key):
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is not None and time.monotonic() - segment.created > self.ttl:
+                self._remove(key)
+                segment = None
+            if segment is not None:
+                self._segments.move_to_end(key)
+            return segment
+
+    def _plan(self, ticker, start, end, threshold, fields, filters):
+        """
+        Looks up the cached segment and works out the fetch_ticker_data calls that complete the query.
+
+        Returns:
+            tuple: (segment or None, dict of 'left'/'right' edge or 'all' -> (args, kwargs)); no calls for a hit.
+        """
+        segment = self._segment((ticker, filters))
+        if segment is not None and segment.covers(start, end, threshold, fields):
+            return segment, {}
+
+        if segment is not None and segment.extends_to(start, end, threshold, fields):
+            fetches = {}
+            # Edges are closed at the segment bounds, since the segment itself excludes them
+            if start < segment.start:
+                fetches['left'] = ((ticker, start, segment.start, segment.threshold, segment.fields), {'include_end': True, 'filters': filters})
+            if end > segment.end:
+                fetches['right'] = ((ticker, segment.end, end, segment.threshold, segment.fields), {'include_start': True, 'filters': filters})
+            return segment, fetches
+
+        fetch_fields = tuple(f for f in pgdb.SENTIMENT_FIELDS if f in fields or f in INDEX_FIELDS)
+        return None, {'all': ((ticker, start, end, threshold, fetch_fields), {'filters': filters})}
+
+    def _complete(self, key, segment, fetched, start, end, threshold, fields):
+        if any(rows is None for rows in fetched.values()):
+            return None
+        if not fetched:
+            with self._lock:
+                self.hits += 1
+            return segment.select(start, end, threshold, fields)
+
+        if segment is not None:
+            merged = _Segment(min(start, segment.start), max(end, segment.end), segment.threshold, segment.fields,
+                              fetched.get('left', []) + segment.rows + fetched.get('right', []))
+            merged.created = segment.created  # The TTL still runs from the oldest rows
+            segment = merged
+            with self._lock:
+                self.partial_hits += 1
+        else:
+            fetch_fields = tuple(f for f in pgdb.SENTIMENT_FIELDS if f in fields or f in INDEX_FIELDS)
+            segment = _Segment(start, end, threshold, fetch_fields, fetched['all'])
+            with self._lock:
+                self.misses += 1
+
+        self._store(key, segment)
+        return segment.select(start, end, threshold, fields)
+
+    def _plan_many(self, tickers, start, end, threshold, fields, filters):
+        result = {ticker: self.get(ticker, start, end, threshold, fields, filters) for ticker in tickers}
+        missing = [ticker for ticker, rows in result.items() if rows is None]
+        fetch_fields = tuple(f for f in pgdb.SENTIMENT_FIELDS if f in fields or f in INDEX_FIELDS)
+        return result, missing, fetch_fields
+
+    def _complete_many(self, result, fetched, start, end, threshold, fields, fetch_fields, filters):
+        if fetched is None:
+            return None
+        for ticker, rows in fetched.items():
+            segment = _Segment(start, end, threshold, fetch_fields, rows)
+            self._store((ticker, filters), segment)
+            result[ticker] = segment.select(start, end, threshold, fields)
+        if fetched:
+            with self._lock:
+                self.misses += len(fetched)
+        return result
+
+    def _store(self, key, segment):
+        if len(segment.rows) > self.max_rows or segment.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._segments:
+                self._remove(key)
+            self._segments[key] = segment
+            self.rows += len(segment.rows)
+            self.size += segment.size
+            while self.rows > self.max_rows or self.size > self.max_bytes:
+                self._remove(next(iter(self._segments)))
+        logger.debug(f"Cached {len(segment.rows)} rows ({segment.size} bytes) for {key[0]} from {segment.start} to {segment.end}")
+
+    def _remove(self, key):
+        segment = self._segments.pop(key)
+        self.rows -= len(segment.rows)
+        self.size -= segment.size
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedBody:
+    def __init__(self, data: bytes, mimetype: str = 'application/json', last_modified=None):
+        self.data = data
+        self.mimetype = mimetype
+        self.last_modified = last_modified
+        self.encodings = {}  # Content encoding -> compressed copy of data
+        self.created = time.monotonic()
+
+    @property
+    def size(self):
+        return len(self.data) + sum(len(body) for body in self.encodings.values())
+
+
+class ResponseCache:
+    """
+    Bounded in-memory cache of serialized response bodies with TTL expiry and LRU eviction.
+
+    Keys are tuples whose second item is the tuple of tickers the response covers, so entries can be
+    invalidated per ticker. Safe to share between the worker threads of one process.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached body for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, data, mimetype='application/json', last_modified=None):
+        """Stores a serialized body, evicting least recently used entries to stay within max_bytes."""
+        entry = CachedBody(data, mimetype, last_modified)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def add_encoding(self, key, encoding, data):
+        """Stores a compressed copy of a cached body, counted against the same byte budget."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or encoding in entry.encodings:
+                return
+            entry.encodings[encoding] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, ticker=None):
+        """Drops every entry, or only those covering the given ticker."""
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+                self.size = 0
+                return
+            for key in [k for k in self._entries if ticker in k[1]]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key).size
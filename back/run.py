@@ -1,5 +1,47 @@
-from waitress import serve
-from app import app
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Importing the app should stay well under this; credentials and the EC2 probe are resolved on first request
+COLD_START_TARGET_MS = float(os.getenv('COLD_START_TARGET_MS', 1000))
+
+
+def import_app(module):
+    """
+    Imports the app module, logging how long it took.
+
+    Args:
+        module (str): 'app' (Flask) or 'asgi_app' (Starlette).
+
+    Returns:
+        The app object.
+    """
+    started = time.perf_counter()
+    app = getattr(__import__(module), 'app')
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    log = logger.warning if elapsed_ms > COLD_START_TARGET_MS else logger.info
+    log(f"Imported {module} in {elapsed_ms:.0f} ms (target {COLD_START_TARGET_MS:.0f} ms)")
+    return app
+
 
 if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=80)
+    parser = argparse.ArgumentParser(description="Serve the sentiment API.")
+    parser.add_argument('--asgi', action='store_true',
+                        help="Serve the async app (uvicorn, psycopg AsyncConnection) instead of Flask on waitress")
+    args = parser.parse_args()
+
+    if args.asgi:
+        import uvicorn
+        if sys.platform == 'win32':
+            # psycopg's async connections don't support the default Proactor event loop
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        # log_config=None leaves uvicorn's loggers (access log included) to the queued, rate-limited root handler
+        uvicorn.run(import_app('asgi_app'), host="0.0.0.0", port=80, log_config=None)
+    else:
+        from waitress import serve
+        serve(import_app('app'), host="0.0.0.0", port=80)
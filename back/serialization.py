@@ -0,0 +1,85 @@
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # format=arrow is unavailable
+    pa = None
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def _default(obj):
+    """Encodes the types psycopg returns that JSON lacks; naive timestamps are UTC, as with orjson's OPT_NAIVE_UTC."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, datetime):
+        return (obj if obj.tzinfo else obj.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serializes obj to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by dumps_bytes, so jsonify and cached bodies encode identically."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s) if orjson is not None else json.loads(s, **kwargs)
+
+
+def to_columnar(rows):
+    """
+    Converts a list of row dictionaries to one list per column, which doesn't repeat the keys per row.
+
+    Returns:
+        dict: Column name -> list of values, in row order (empty for no rows).
+    """
+    if not rows:
+        return {}
+    return {column: [row[column] for row in rows] for column in rows[0]}
+
+
+def _arrow_type(column):
+    """Arrow type of a known response column, or None to let pyarrow infer it."""
+    if column in ('time_published', 'bucket'):
+        return pa.timestamp('us')
+    if column in ('article_id', 'count'):
+        return pa.int64()
+    if column.endswith('_score') or column.endswith('_sentiment') or column.endswith('_relevance'):
+        return pa.float64()
+    if column in ('ticker', 'source', 'url', 'title', 'summary', 'authors', 'tickers_json', 'topics_json'):
+        return pa.string()
+    return None
+
+
+def to_arrow_ipc(columns):
+    """
+    Serializes columns (name -> list of values) as an Arrow IPC stream with typed timestamp, float and string columns.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed.
+    """
+    if pa is None:
+        raise RuntimeError("format=arrow requires pyarrow")
+    table = pa.table({name: pa.array(values, type=_arrow_type(name)) for name, values in columns.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
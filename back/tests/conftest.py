@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules, as when run from back/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests never touch the database; don't probe the EC2 metadata endpoint either
+os.environ.setdefault('RUNNING_ON_EC2', '0')
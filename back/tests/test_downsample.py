@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from downsample import downsample_columns, downsample_rows, lttb_indices
+
+
+def reference_lttb(x, y, max_points):
+    """Textbook largest-triangle-three-buckets, one point at a time."""
+    n = len(x)
+    every = (n - 2) / (max_points - 2)
+    selected, a = [0], 0
+    for i in range(max_points - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        cx, cy = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        areas = [abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a])) for j in range(start, end)]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+@pytest.mark.parametrize('n, max_points', [(10, 3), (100, 7), (1000, 50), (1001, 999), (5000, 100)])
+def test_matches_reference_plus_extremes(n, max_points):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.integers(1, 100, n)).astype(float)
+    y = rng.normal(size=n)
+    indices = lttb_indices(x, y, max_points)
+
+    expected = set(reference_lttb(x, y, max_points))
+    assert expected <= set(indices.tolist())
+    assert set(indices.tolist()) - expected <= {int(np.argmin(y)), int(np.argmax(y))}
+    assert list(indices) == sorted(set(indices.tolist()))
+    assert len(indices) <= max_points + 2
+
+
+def test_keeps_first_last_and_extremes():
+    y = np.zeros(1000)
+    y[123], y[877] = 5., -5.  # Spikes that a bucket's triangle can miss
+    indices = lttb_indices(np.arange(1000), y, 10).tolist()
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 123 in indices and 877 in indices
+
+
+def test_short_series_are_kept_whole():
+    assert lttb_indices(np.arange(5), np.arange(5.), 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(np.arange(3), np.arange(3.), 10).tolist() == [0, 1, 2]
+
+
+def test_rows_and_columns_keep_the_same_points():
+    base = datetime(2024, 1, 1)
+    rows = [{'article_id': i, 'time_published': base + timedelta(minutes=i),
+             'sentiment_score': None if i % 11 == 0 else np.sin(i / 20)} for i in range(2000)]
+    sampled = downsample_rows(rows, 50)
+    assert sampled[0] is rows[0] and sampled[-1] is rows[-1]
+    assert [row['time_published'] for row in sampled] == sorted(row['time_published'] for row in sampled)
+
+    columns = {name: [row[name] for row in rows] for name in rows[0]}
+    assert downsample_columns(columns, 50)['article_id'] == [row['article_id'] for row in sampled]
+    assert downsample_rows(rows[:50], 50) == rows[:50]
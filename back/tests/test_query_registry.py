@@ -0,0 +1,24 @@
+from query_registry import QueryRegistry
+
+
+def test_statements_are_built_once_per_shape():
+    registry, built = QueryRegistry(), []
+
+    def build():
+        built.append(1)
+        return 'SELECT 1'
+
+    assert registry.statement('q', build, ('a',)) is registry.statement('q', build, ('a',))
+    registry.statement('q', build, ('b',))
+    assert len(built) == 2
+    assert registry.stats()['q']['variants'] == 2
+
+
+def test_least_recently_used_shapes_are_evicted():
+    registry = QueryRegistry(max_statements=2)
+    first = registry.statement('q', lambda: 'SELECT 1', 1)
+    registry.statement('q', lambda: 'SELECT 2', 2)
+    assert registry.statement('q', lambda: 'SELECT 1', 1) is first
+    registry.statement('q', lambda: 'SELECT 3', 3)
+    assert registry.stats()['q']['variants'] == 2 and registry.evictions == 1
+    assert registry.statement('q', lambda: 'SELECT 1', 1) is first  # 2 was the least recently used
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import postgres_db as pgdb
+from range_cache import TickerRangeCache
+
+BASE = datetime(2024, 1, 1)
+# Hourly rows, so query bounds on whole hours fall exactly on rows and test the open/closed edges
+ROWS = [{'article_id': i, 'time_published': BASE + timedelta(hours=i), 'relevance_score': (i % 10 + 1) / 10,
+         'sentiment_score': (i % 7) / 10, 'source': f'src{i % 3}', 'url': f'http://x/{i}', 'summary': 's' * 200}
+        for i in range(24 * 60)]
+FIELDS = ('article_id', 'time_published', 'sentiment_score', 'relevance_score')
+SOURCE_FILTER = pgdb.SentimentFilters(sources=('src1',))
+
+
+def matching(ticker, start, end, threshold, fields, include_start=False, include_end=False, filters=pgdb.NO_FILTERS):
+    """What fetch_ticker_data returns for the query, from ROWS."""
+    return [{f: row[f] for f in fields} for row in ROWS
+            if (start <= row['time_published'] if include_start else start < row['time_published'])
+            and (row['time_published'] <= end if include_end else row['time_published'] < end)
+            and row['relevance_score'] > threshold
+            and (not filters.sources or row['source'] in filters.sources)]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replaces the database fetches with ROWS and records their arguments."""
+    calls = []
+
+    def fetch_ticker_data(ticker, start, end, threshold, fields=pgdb.DEFAULT_FIELDS, include_start=False,
+                          include_end=False, filters=pgdb.NO_FILTERS):
+        calls.append({'start': start, 'end': end, 'threshold': threshold, 'fields': fields,
+                      'include_start': include_start, 'include_end': include_end, 'filters': filters})
+        return matching(ticker, start, end, threshold, fields, include_start, include_end, filters)
+
+    def fetch_tickers_data(tickers, start, end, threshold, fields=pgdb.DEFAULT_FIELDS, filters=pgdb.NO_FILTERS):
+        calls.append({'tickers': tickers, 'start': start, 'end': end, 'threshold': threshold, 'fields': fields})
+        return {ticker: matching(ticker, start, end, threshold, fields, filters=filters) for ticker in tickers}
+
+    monkeypatch.setattr(pgdb, 'fetch_ticker_data', fetch_ticker_data)
+    monkeypatch.setattr(pgdb, 'fetch_tickers_data', fetch_tickers_data)
+    return calls
+
+
+def day(n):
+    return BASE + timedelta(days=n)
+
+
+def test_contained_query_is_a_hit(calls):
+    cache = TickerRangeCache()
+    assert cache.query('AAPL', day(5), day(20), 0., FIELDS) == matching('AAPL', day(5), day(20), 0., FIELDS)
+    assert cache.query('AAPL', day(8), day(10), 0., FIELDS) == matching('AAPL', day(8), day(10), 0., FIELDS)
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('start, end', [(day(2), day(12)), (day(15), day(30)), (day(1), day(40))])
+def test_overlapping_query_fetches_closed_edges(calls, start, end):
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(10), day(20), 0., FIELDS)
+    rows = cache.query('AAPL', start, end, 0., FIELDS)
+
+    # The rows exactly on the old segment's bounds are fetched once: by the edges, which are closed there
+    assert rows == matching('AAPL', start, end, 0., FIELDS)
+    edges = calls[1:]
+    assert all(call['include_end'] for call in edges if call['end'] == day(10))
+    assert all(call['include_start'] for call in edges if call['start'] == day(20))
+    assert len(edges) == (start < day(10)) + (end > day(20))
+    assert cache.stats()['partial_hits'] == 1
+    # The widened segment now answers the whole range
+    assert cache.query('AAPL', start, end, 0., FIELDS) == rows
+    assert len(calls) == 1 + len(edges)
+
+
+def test_edges_keep_the_segment_threshold(calls):
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(10), day(20), 0.2, FIELDS)
+    rows = cache.query('AAPL', day(5), day(20), 0.5, FIELDS)
+    assert rows == matching('AAPL', day(5), day(20), 0.5, FIELDS)
+    assert calls[1]['threshold'] == 0.2
+    # Lower thresholds than the cached one are answered again, since the segment lacks those rows
+    assert cache.query('AAPL', day(6), day(8), 0.2, FIELDS) == matching('AAPL', day(6), day(8), 0.2, FIELDS)
+    assert len(calls) == 2
+
+
+def test_threshold_and_fields_containment(calls):
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(0), day(30), 0.3, FIELDS)
+
+    assert cache.query('AAPL', day(1), day(2), 0.7, FIELDS) == matching('AAPL', day(1), day(2), 0.7, FIELDS)
+    assert cache.query('AAPL', day(1), day(2), 0.3, ('time_published',)) == matching('AAPL', day(1), day(2), 0.3, ('time_published',))
+    assert len(calls) == 1
+
+    assert cache.query('AAPL', day(1), day(2), 0.1, FIELDS) == matching('AAPL', day(1), day(2), 0.1, FIELDS)
+    assert cache.query('AAPL', day(1), day(2), 0.3, FIELDS + ('url',)) == matching('AAPL', day(1), day(2), 0.3, FIELDS + ('url',))
+    assert len(calls) == 3
+    # Fetches add the fields needed to re-apply ranges and thresholds in memory
+    assert {'time_published', 'relevance_score'} <= set(calls[-1]['fields'])
+
+
+def test_filters_are_cached_separately(calls):
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(0), day(10), 0., FIELDS)
+    rows = cache.query('AAPL', day(1), day(2), 0., FIELDS, SOURCE_FILTER)
+    assert rows == matching('AAPL', day(1), day(2), 0., FIELDS, filters=SOURCE_FILTER)
+    assert calls[-1]['filters'] == SOURCE_FILTER
+    assert cache.stats()['segments'] == 2
+    cache.invalidate('AAPL')
+    assert cache.stats()['segments'] == 0
+
+
+def test_query_many_fetches_only_missing_tickers(calls):
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(0), day(10), 0., FIELDS)
+    result = cache.query_many(['AAPL', 'MSFT'], day(1), day(5), 0., FIELDS)
+    assert result == {ticker: matching(ticker, day(1), day(5), 0., FIELDS) for ticker in ('AAPL', 'MSFT')}
+    assert calls[-1]['tickers'] == ['MSFT']
+
+
+def test_size_bounds_evict_least_recently_used(calls):
+    fields = FIELDS + ('summary',)
+    cache = TickerRangeCache()
+    cache.query('AAPL', day(0), day(10), 0., fields)
+    segment_size = cache.stats()['bytes']
+    assert segment_size > 0
+
+    cache = TickerRangeCache(max_bytes=int(segment_size * 2.5))
+    for ticker in ('A', 'B', 'C'):
+        cache.query(ticker, day(0), day(10), 0., fields)
+    stats = cache.stats()
+    assert stats['segments'] == 2 and stats['bytes'] <= cache.max_bytes
+    cache.query('A', day(1), day(2), 0., fields)
+    assert len(calls) == 5  # A was evicted first
+
+    cache = TickerRangeCache(max_bytes=segment_size // 2)
+    cache.query('AAPL', day(0), day(10), 0., fields)
+    assert cache.stats()['segments'] == 0  # Larger than the whole cache: served, not stored
@@ -23,17 +23,35 @@ import { environment } from '../../environments/environment'; // Import environm
 Chart.register(...registerables, zoomPlugin);
 
 interface SentimentData {
+  article_id: number;
   time_published: string;
-  relevance_score: string;
-  sentiment_score: string;
+  relevance_score: number;
+  sentiment_score: number;
   title: string;
-  summary: string;
   url: string;
   source: string;
-  tickers_json: Array<{ ticker: string; relevance_score: string; ticker_sentiment_score: string; ticker_sentiment_label: string }>;
   topics_json: Array<{ topic: string; relevance_score: string}>;
 }
 
+// Batch response with shape=articles: each article once, plus per-ticker columnar series referencing them
+interface ArticlesBatch {
+  articles: { [articleId: string]: Omit<SentimentData, 'article_id' | 'sentiment_score' | 'relevance_score'> };
+  series: { [ticker: string]: { article_id?: number[]; sentiment_score?: number[]; relevance_score?: number[] } };
+}
+
+interface FacetCount {
+  value: string;
+  count: number;
+}
+
+interface Facets {
+  sources: FacetCount[];
+  topics: FacetCount[];
+}
+
+// The backend's cap on tickers per /api/sentiment/batch request (MAX_BATCH_TICKERS in app.py)
+const MAX_BATCH_TICKERS = 20;
+
 @Component({
   selector: 'app-sentiment-chart',
   templateUrl: './sentiment-chart.component.html',
@@ -54,7 +72,6 @@ interface SentimentData {
   ]
 })
 
-
 export class SentimentChartComponent implements OnInit {
   chart: Chart | undefined;
   dateForm: FormGroup;
@@ -72,9 +89,13 @@ export class SentimentChartComponent implements OnInit {
   selectedTopicsControl: FormControl; // FormControl for selected topics
   topicRelevanceScoreControl: FormControl; // FormControl for topic relevance score
 
+  // Response fields used by the chart, tooltip and filters; the dialog loads the rest per article
+  readonly requestedFields = ['article_id', 'time_published', 'sentiment_score', 'relevance_score', 'source', 'url', 'title', 'topics_json'];
+
   lastStartDate: string | null = null;
   lastEndDate: string | null = null;
   lastRelevanceScore: number | null = null;
+  lastFilterParams: string = '';
 
   constructor(private http: HttpClient, private fb: FormBuilder, @Inject(PLATFORM_ID) private platformId: Object, private dialog: MatDialog) {
     this.dateForm = this.fb.group({
@@ -181,45 +202,103 @@ export class SentimentChartComponent implements OnInit {
   loadData(ticker: string): void {
     if (!ticker || this.fetchedTickers.has(ticker)) return; // Prevent reloading data for already fetched tickers
 
-    const tickers = this.tickersList.filter(ticker => ticker.trim() !== '');
+    // Fetch every ticker that isn't loaded yet, in batch requests of at most MAX_BATCH_TICKERS tickers
+    const tickers = this.tickersList.filter(ticker => ticker.trim() !== '' && !this.fetchedTickers.has(ticker));
+    if (tickers.length === 0) return;
     const startDate = format(this.dateForm.get('startDate')?.value ?? new Date('2023-01-01'), 'yyyy-MM-dd');
     const endDate = format(this.dateForm.get('endDate')?.value ?? new Date(), 'yyyy-MM-dd');
     const relevanceScore = this.dateForm.get('relevanceScore')?.value || 0;
 
-    tickers.forEach((ticker: string) => {
-      if (this.fetchedTickers.has(ticker)) {
-        return;
-      }
+    const filterParams = this.filterParams();
+    this.loadFacets(startDate, endDate); // Filter options don't depend on the rows, so fetch them alongside
 
-      this.fetchedTickers.add(ticker);
-      const apiUrl = `${environment.apiUrl}/sentiment?ticker=${ticker}&start_date=${startDate}&end_date=${endDate}&relevance_score=${relevanceScore}`; // Use environment.apiUrl
-      console.log('API URL:', environment.apiUrl); // Log API URL
-      console.log('Fetching data from API:', apiUrl);
+    for (let i = 0; i < tickers.length; i += MAX_BATCH_TICKERS) {
+      this.loadBatch(tickers.slice(i, i + MAX_BATCH_TICKERS), startDate, endDate, relevanceScore, filterParams);
+    }
+  }
 
-      this.http.get<SentimentData[]>(apiUrl).subscribe({
-        next: (data: SentimentData[]) => {
+  // Fetches one batch of tickers; a failed batch leaves its tickers listed, to be retried on the next refresh
+  loadBatch(tickers: string[], startDate: string, endDate: string, relevanceScore: number, filterParams: string): void {
+    tickers.forEach(ticker => this.fetchedTickers.add(ticker));
+    const tickersParam = tickers.map(ticker => encodeURIComponent(ticker)).join(',');
+    const apiUrl = `${environment.apiUrl}/sentiment/batch?tickers=${tickersParam}&start_date=${startDate}&end_date=${endDate}&relevance_score=${relevanceScore}&fields=${this.requestedFields.join(',')}&shape=articles${filterParams}`; // Use environment.apiUrl
+    console.log('API URL:', environment.apiUrl); // Log API URL
+    console.log('Fetching data from API:', apiUrl);
+
+    this.http.get<ArticlesBatch>(apiUrl).subscribe({
+      next: (batch: ArticlesBatch) => {
+        tickers.forEach(ticker => {
+          const data = this.joinSeries(batch, ticker);
+          if (!data || (data.length === 0 && !filterParams)) { // With filters set, no matching rows is a valid result
+            this.removeTickerByName(ticker); // Remove from list if no data
+            alert(`No data found for ticker: ${ticker}. It will be removed.`);
+            return;
+          }
           console.log('API data received for', ticker, ':', data);
           this.fullData[ticker] = data;
-          this.extractSources(data); // Extract unique sources
-          this.extractTopics(data); // Extract unique topics
-          this.updateChart();
-        },
-        error: error => {
-          console.error('API request error for', ticker, ':', error);
-          this.removeTickerByName(ticker); // Remove from list if error
-          alert(`Error fetching data for ticker: ${ticker}. It will be removed.`);
-        },
-        complete: () => {
-          console.log('API request completed for', ticker);
+        });
+        this.updateChart();
+      },
+      error: error => {
+        console.error('API request error for', tickers, ':', error);
+        tickers.forEach(ticker => {
+          this.fetchedTickers.delete(ticker); // Not loaded, so the next refresh retries it
           this.loadingTickers.delete(ticker);
-        }
-      });
+        });
+        alert(`Error fetching data for tickers: ${tickers.join(', ')}. Please try again.`);
+      },
+      complete: () => {
+        console.log('API request completed for', tickers);
+        tickers.forEach(ticker => this.loadingTickers.delete(ticker));
+      }
+    });
+  }
+
+  // Rebuilds a ticker's rows from its series and the shared articles map
+  joinSeries(batch: ArticlesBatch, ticker: string): SentimentData[] | undefined {
+    const series = batch.series[ticker];
+    if (!series) return undefined;
+    const ids = series.article_id ?? [];
+    return ids.map((id, i) => ({
+      ...batch.articles[id],
+      article_id: id,
+      sentiment_score: series.sentiment_score![i],
+      relevance_score: series.relevance_score![i]
+    }));
+  }
+
+  // Source and topic filters, applied by the backend so filtered-out rows are never downloaded
+  filterParams(): string {
+    const list = (values: string[]) => values.map(value => encodeURIComponent(value)).join(',');
+    const selectedSources: string[] = this.selectedSourcesControl.value;
+    const excludedSources: string[] = this.excludedSourcesControl.value;
+    const selectedTopics: string[] = this.selectedTopicsControl.value;
+    let params = '';
+    if (selectedSources.length > 0) params += `&sources=${list(selectedSources)}`;
+    if (excludedSources.length > 0) params += `&exclude_sources=${list(excludedSources)}`;
+    if (selectedTopics.length > 0) params += `&topics=${list(selectedTopics)}&topic_relevance=${this.topicRelevanceScoreControl.value || 0}`;
+    return params;
+  }
+
+  // Sources and topics of all listed tickers, counted by the backend instead of scanning the downloaded rows
+  loadFacets(startDate: string, endDate: string): void {
+    const tickersParam = this.tickersList.filter(ticker => ticker.trim() !== '').map(ticker => encodeURIComponent(ticker)).join(',');
+    if (!tickersParam) return;
+    const apiUrl = `${environment.apiUrl}/facets?ticker=${tickersParam}&start_date=${startDate}&end_date=${endDate}`;
+
+    this.http.get<Facets>(apiUrl).subscribe({
+      next: (facets: Facets) => {
+        this.extractSources(facets.sources); // Extract unique sources
+        this.extractTopics(facets.topics); // Extract unique topics
+      },
+      error: error => {
+        console.error('Facets request error:', error);
+      }
     });
   }
 
-  extractSources(data: SentimentData[]): void {
-    const sources = data.map(d => d.source);
-    const uniqueSources = Array.from(new Set(sources)).sort(); // Sort the sources alphabetically
+  extractSources(facets: FacetCount[]): void {
+    const uniqueSources = facets.map(f => f.value).sort(); // Sort the sources alphabetically
     uniqueSources.forEach(source => {
       if (!this.sourcesList.includes(source)) {
         this.sourcesList.push(source);
@@ -228,9 +307,8 @@ export class SentimentChartComponent implements OnInit {
     });
   }
 
-  extractTopics(data: SentimentData[]): void {
-    const topics = data.flatMap(d => d.topics_json.map(t => t.topic));
-    const uniqueTopics = Array.from(new Set(topics)).sort(); // Sort the topics alphabetically
+  extractTopics(facets: FacetCount[]): void {
+    const uniqueTopics = facets.map(f => f.value).sort(); // Sort the topics alphabetically
     uniqueTopics.forEach(topic => {
       if (!this.topicsList.includes(topic)) {
         this.topicsList.push(topic);
@@ -261,36 +339,21 @@ export class SentimentChartComponent implements OnInit {
       return;
     }
 
-    const selectedSources = this.selectedSourcesControl.value;
-    const excludedSources = this.excludedSourcesControl.value; // Get the excluded sources
-    const selectedTopics = this.selectedTopicsControl.value;
-    const topicRelevanceThreshold = this.topicRelevanceScoreControl.value;
-
     const plotLines = this.dateForm.get('plotLines')?.value;
 
-    // Create a mapping from the filtered data points to the original data points
-    const dataPointMapping: { [key: string]: SentimentData[] } = {};
+    // Data points per ticker, already filtered by source and topic on the backend
+    const dataPointMapping: { [key: string]: SentimentData[] } = this.fullData;
 
     const datasets = Object.keys(this.fullData).map((ticker) => {
-      const dataPoints = this.fullData[ticker];
-
-      const filteredDataPoints = dataPoints.filter(d => {
-        const sourceMatch = selectedSources.length === 0 || selectedSources.includes(d.source);
-        const excludeSourceMatch = excludedSources.length > 0 && excludedSources.includes(d.source);
-        const topicMatch = selectedTopics.length === 0 || d.topics_json.some(t => selectedTopics.includes(t.topic) && parseFloat(t.relevance_score) >= topicRelevanceThreshold);
-        return sourceMatch && !excludeSourceMatch && topicMatch; // Apply exclude sources condition
-      });
-
-      // Store the mapping
-      dataPointMapping[ticker] = filteredDataPoints;
+      const filteredDataPoints = this.fullData[ticker];
 
-      const dates: Point[] = filteredDataPoints.map((d: SentimentData) => ({ x: new Date(d.time_published).getTime(), y: parseFloat(d.sentiment_score) }));
-      const relevance = filteredDataPoints.map((d: SentimentData) => parseFloat(d.relevance_score));
+      const dates: Point[] = filteredDataPoints.map((d: SentimentData) => ({ x: new Date(d.time_published).getTime(), y: d.sentiment_score }));
+      const relevance = filteredDataPoints.map((d: SentimentData) => d.relevance_score);
       const scaleByRelevance = this.dateForm.get('scaleByRelevance')?.value;
       const scaleCircleByRelevance = this.dateForm.get('scaleCircleByRelevance')?.value;
 
       const scores = scaleByRelevance
-        ? filteredDataPoints.map((d, index) => ({ x: new Date(d.time_published).getTime(), y: parseFloat(d.sentiment_score) * relevance[index] }))
+        ? filteredDataPoints.map((d, index) => ({ x: new Date(d.time_published).getTime(), y: d.sentiment_score * relevance[index] }))
         : dates;
       const color = this.colorMap[ticker];
 
@@ -367,20 +430,16 @@ export class SentimentChartComponent implements OnInit {
 
                 if (dataPoints) {
                   const dataPoint = dataPoints[context.dataIndex];
-                  const numOfRelatedTickers = dataPoint.tickers_json.length;
                   const numOfTopics = dataPoint.topics_json.length;
 
+                  // Summary and ticker sentiment are loaded by the dialog on click
                   return [
                     `URL: ${dataPoint.url}`,
                     `Source: ${dataPoint.source}`,
                     `Date: ${dataPoint.time_published}`,
-                    `Score: ${parseFloat(dataPoint.sentiment_score).toFixed(2)}`,
-                    `Relevance: ${parseFloat(dataPoint.relevance_score).toFixed(2)}`,
+                    `Score: ${dataPoint.sentiment_score.toFixed(2)}`,
+                    `Relevance: ${dataPoint.relevance_score.toFixed(2)}`,
                     `Title: ${dataPoint.title}`,
-                    `Summary: ${dataPoint.summary}`,
-                    `Number of Related Tickers: ${numOfRelatedTickers}`,
-                    `Ticker Sentiment:\n${dataPoint.tickers_json.map((item: any) =>
-                      `Ticker: ${item.ticker}, Relevance Score: ${parseFloat(item.relevance_score).toFixed(2)}, Score: ${parseFloat(item.ticker_sentiment_score).toFixed(2)}, Label: ${item.ticker_sentiment_label}`).join('\n')}`,
                     `Number of Associated Topics: ${numOfTopics}`,
                     `Topic Relevance:\n${dataPoint.topics_json.map((item: any) => `${item.topic}: ${parseFloat(item.relevance_score).toFixed(2)}`).join('\n')}`
                   ];
@@ -419,6 +478,7 @@ export class SentimentChartComponent implements OnInit {
     const currentStartDate = format(this.dateForm.get('startDate')?.value ?? new Date('2024-01-01'), 'yyyy-MM-dd');
     const currentEndDate = format(this.dateForm.get('endDate')?.value ?? new Date(), 'yyyy-MM-dd');
     const currentRelevanceScore = this.dateForm.get('relevanceScore')?.value || 0;
+    const currentFilterParams = this.filterParams();
 
     // Check if the new date range is outside the last fetched date range
     const isOutsideFetchedRange =
@@ -427,13 +487,14 @@ export class SentimentChartComponent implements OnInit {
       currentStartDate < this.lastStartDate ||
       currentEndDate > this.lastEndDate;
 
-    // Refresh data if the new date range is outside the last fetched date range
-    if (isOutsideFetchedRange || this.lastRelevanceScore !== currentRelevanceScore) {
+    // Refresh data if the new date range is outside the last fetched date range or the filters changed
+    if (isOutsideFetchedRange || this.lastRelevanceScore !== currentRelevanceScore || this.lastFilterParams !== currentFilterParams) {
       this.fetchedTickers.clear(); // Clear the fetched tickers set to force refreshing all data
       this.tickersList.forEach(ticker => this.loadData(ticker));
       this.lastStartDate = currentStartDate;
       this.lastEndDate = currentEndDate;
       this.lastRelevanceScore = currentRelevanceScore;
+      this.lastFilterParams = currentFilterParams;
     } else {
       // If no need to refresh data, just update the chart
       this.updateChart();
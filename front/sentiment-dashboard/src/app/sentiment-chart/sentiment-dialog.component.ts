@@ -1,8 +1,10 @@
-import { Component, Inject } from '@angular/core';
+import { Component, Inject, OnInit } from '@angular/core';
 import { MAT_DIALOG_DATA } from '@angular/material/dialog';
 import { CommonModule } from '@angular/common';
+import { HttpClient } from '@angular/common/http';
 import { MatDialogModule } from '@angular/material/dialog';
 import { MatButtonModule } from '@angular/material/button';
+import { environment } from '../../environments/environment';
 
 @Component({
   selector: 'app-sentiment-dialog',
@@ -15,13 +17,18 @@ import { MatButtonModule } from '@angular/material/button';
       <p><strong>Score:</strong> {{ data.sentiment_score }}</p>
       <p><strong>Relevance:</strong> {{ data.relevance_score }}</p>
       <p><strong>Title:</strong> {{ data.title }}</p>
-      <p><strong>Summary:</strong> <span class="summary">{{ data.summary }}</span></p>
-      <p><strong>Number of Related Tickers:</strong> {{ data.tickers_json.length }}</p>
-      <p><strong>Ticker Sentiment:</strong></p>
-      <pre>{{ formatJsonData(data.tickers_json) }}</pre>
-      <p><strong>Number of Associated Topics:</strong> {{ data.topics_json.length }}</p>
-      <p><strong>Topic Relevance:</strong></p>
-      <pre>{{ formatTopicRelevance(data.topics_json) }}</pre>
+      <ng-container *ngIf="article; else loading">
+        <p><strong>Summary:</strong> <span class="summary">{{ article.summary }}</span></p>
+        <p><strong>Number of Related Tickers:</strong> {{ article.tickers_json.length }}</p>
+        <p><strong>Ticker Sentiment:</strong></p>
+        <pre>{{ formatJsonData(article.tickers_json) }}</pre>
+        <p><strong>Number of Associated Topics:</strong> {{ article.topics_json.length }}</p>
+        <p><strong>Topic Relevance:</strong></p>
+        <pre>{{ formatTopicRelevance(article.topics_json) }}</pre>
+      </ng-container>
+      <ng-template #loading>
+        <p>{{ loadError ? 'Failed to load article details.' : 'Loading details...' }}</p>
+      </ng-template>
     </mat-dialog-content>
     <mat-dialog-actions>
       <button mat-button mat-dialog-close>Close</button>
@@ -48,8 +55,21 @@ import { MatButtonModule } from '@angular/material/button';
     MatButtonModule
   ]
 })
-export class SentimentDialogComponent {
-  constructor(@Inject(MAT_DIALOG_DATA) public data: any) {}
+export class SentimentDialogComponent implements OnInit {
+  article: any = null; // Full article detail, fetched when the dialog opens
+  loadError = false;
+
+  constructor(@Inject(MAT_DIALOG_DATA) public data: any, private http: HttpClient) {}
+
+  ngOnInit(): void {
+    this.http.get<any>(`${environment.apiUrl}/article/${this.data.article_id}`).subscribe({
+      next: article => this.article = article,
+      error: error => {
+        console.error('Article request error for', this.data.article_id, ':', error);
+        this.loadError = true;
+      }
+    });
+  }
 
   formatJsonData(jsonData: any[]): string {
     return jsonData.map(item =>